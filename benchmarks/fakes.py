@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-process stand-ins for ``spotipy`` and ``gmusicapi``, used by the offline
+benchmarks.
+
+The fake clients serve a synthetic catalog of tracks. Every call can be given
+a fixed latency, and every Nth call can be throttled with an HTTP 429, so the
+rate limiting and retry paths are exercised too. Call counts are kept per
+method.
+"""
+
+import collections
+import datetime
+import re
+import sys
+import threading
+import time
+import types
+
+BASE62 = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+TRACK_NUMBER = re.compile(r"Track (\d+)\b")
+ALBUM_NUMBER = re.compile(r"Album (\d+)\b")
+# Every album has this many tracks, all by the same artist
+ALBUM_SIZE = 12
+
+
+class TooManyRequests(Exception):
+    """A generic HTTP 429, raised by fakes that do not have their own."""
+
+    def __init__(self):
+        super(TooManyRequests, self).__init__("429 Too Many Requests")
+        self.http_status = 429
+        self.headers = {"Retry-After": "0"}
+
+
+class FakeService(object):
+    """Shared behaviour of the fake clients: latency, throttling, counting."""
+
+    def __init__(self, latency=0.0, throttle_every=0):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] = self.calls[name] + 1
+            total = sum(self.calls.values())
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.throttle_every and total % self.throttle_every == 0:
+            self._throttled()
+
+    def _throttled(self):
+        """Fail a throttled call. Clients raise their own kind of error."""
+        raise TooManyRequests()
+
+
+def get_track_id(number):
+    """A 22 character Spotify-style ID for a track number."""
+    digits = list()
+    number = number + 62 ** 10
+    while number:
+        number, digit = divmod(number, 62)
+        digits.append(BASE62[digit])
+    return "".join(reversed(digits)).rjust(22, "0")
+
+
+def get_track_number(track_id):
+    """The track number of a Spotify-style track ID."""
+    number = 0
+    for character in track_id.lstrip("0"):
+        number = number * 62 + BASE62.index(character)
+    return number - 62 ** 10
+
+
+def get_spotify_track(number):
+    """A Spotify track object for a track number."""
+    return {
+        'id': get_track_id(number),
+        'name': f"Track {number}",
+        'artists': [{'name': get_artist(number)}],
+        'album': {'name': f"Album {number // ALBUM_SIZE}"},
+        'external_ids': {'isrc': f"USBNC{number:07d}"},
+    }
+
+
+def get_store_track(number):
+    """An All Access track object for a track number."""
+    return {
+        'storeId': f"T{number:09d}",
+        'nid': f"T{number:09d}",
+        'title': f"Track {number}",
+        'artist': get_artist(number),
+        'album': f"Album {number // ALBUM_SIZE}",
+        'albumId': f"B{number // ALBUM_SIZE:09d}",
+    }
+
+
+def get_artist(number):
+    """The artist of a track number."""
+    return f"Artist {number // ALBUM_SIZE % 997}"
+
+
+class SpotifyException(Exception):
+    """Mirrors ``spotipy.SpotifyException``."""
+
+    def __init__(self, http_status, code, msg, headers=None):
+        super().__init__(f"http status: {http_status}, code:{code} - {msg}")
+        self.http_status = http_status
+        self.code = code
+        self.msg = msg
+        self.headers = headers or {}
+
+
+class FakeSpotify(FakeService):
+    """
+    A stand-in for ``spotipy.Spotify`` that serves one playlist of
+    ``playlist_size`` tracks, a library of the same tracks saved one minute
+    apart, and any track by ID.
+    """
+
+    playlist_size = 0
+    max_page = 100
+    max_tracks = 50
+    latency = 0.0
+    throttle_every = 0
+    instances = list()
+
+    def __init__(self, auth=None, auth_manager=None, requests_session=None,
+                 **kwargs):
+        super().__init__(type(self).latency, type(self).throttle_every)
+        type(self).instances.append(self)
+
+    def _throttled(self):
+        raise SpotifyException(429, -1, "API rate limit exceeded",
+                               headers={"Retry-After": "0"})
+
+    def tracks(self, tracks, market=None):
+        self._call("tracks")
+        if len(tracks) > self.max_tracks:
+            raise SpotifyException(400, -1, "Too many ids requested")
+        return {'tracks': [
+            get_spotify_track(get_track_number(track_id)) for track_id in tracks
+        ]}
+
+    def playlist(self, playlist_id, fields=None, **kwargs):
+        self._call("playlist")
+        return {
+            'name': "Bench",
+            'snapshot_id': f"snapshot-{self.playlist_size}",
+            'tracks': {'total': self.playlist_size},
+        }
+
+    def user_playlist(self, user, playlist_id=None, fields=None, **kwargs):
+        return self.playlist(playlist_id, fields)
+
+    def playlist_tracks(self, playlist_id, fields=None, limit=100, offset=0,
+                        **kwargs):
+        self._call("playlist_tracks")
+        if limit > self.max_page:
+            raise SpotifyException(400, -1, "Invalid limit")
+
+        end = min(self.playlist_size, offset + limit)
+        return {
+            'items': [
+                {'track': get_spotify_track(number)}
+                for number in range(offset, end)
+            ],
+            'total': self.playlist_size,
+            'offset': offset,
+            'limit': limit,
+            'next': None if end >= self.playlist_size else "next",
+        }
+
+    def user_playlist_tracks(self, user, playlist_id=None, fields=None,
+                             limit=100, offset=0, **kwargs):
+        return self.playlist_tracks(playlist_id, fields, limit, offset)
+
+    def current_user_saved_tracks(self, limit=20, offset=0, market=None):
+        self._call("current_user_saved_tracks")
+        if limit > self.max_tracks:
+            raise SpotifyException(400, -1, "Invalid limit")
+
+        end = min(self.playlist_size, offset + limit)
+        return {
+            'items': [
+                {'added_at': get_added_at(number),
+                 'track': get_spotify_track(number)}
+                for number in range(offset, end)
+            ],
+            'total': self.playlist_size,
+            'offset': offset,
+            'limit': limit,
+            'next': None if end >= self.playlist_size else "next",
+        }
+
+
+def get_added_at(number):
+    """When saved track N was added. Track 0 is the newest."""
+    added_at = datetime.datetime(2020, 1, 1) - datetime.timedelta(minutes=number)
+    return added_at.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class CallFailure(Exception):
+    """Mirrors ``gmusicapi.exceptions.CallFailure``."""
+
+
+class FakeMobileclient(FakeService):
+    """
+    A stand-in for ``gmusicapi.Mobileclient``. Every search for "Track N"
+    finds store track N, except every ``miss_every`` track, which has no
+    results. A search for "Album N" finds album N. The user owns one
+    playlist, "Bench", of ``playlist_size`` tracks.
+
+    Only the number of tracks added to new playlists is kept, so the fake
+    does not add to the memory used by the command being measured.
+    """
+
+    playlist_size = 0
+    miss_every = 20
+    latency = 0.0
+    throttle_every = 0
+    instances = list()
+
+    def __init__(self, debug_logging=True, validate=True, verify_ssl=True):
+        super().__init__(type(self).latency, type(self).throttle_every)
+        type(self).instances.append(self)
+        self.session = types.SimpleNamespace(
+            _rsession=None, _rsession_setup=lambda session: session
+        )
+        self.playlists = {
+            'bench': {
+                'id': 'bench', 'name': 'Bench', 'shareToken': 'bench-share',
+                'accessControlled': False, 'type': 'USER_GENERATED',
+                'lastModifiedTimestamp': '1',
+            }
+        }
+        self.added = collections.Counter()
+
+    def _throttled(self):
+        raise CallFailure("429 Too Many Requests")
+
+    def oauth_login(self, device_id, oauth_credentials=None, locale='en_US'):
+        self._call("oauth_login")
+        return True
+
+    def search(self, query, max_results=50):
+        self._call("search")
+        match = TRACK_NUMBER.search(query)
+        hits = list()
+        if match:
+            number = int(match.group(1))
+            if not self.miss_every or (number + 1) % self.miss_every:
+                hits.append({'track': get_store_track(number)})
+
+        match = ALBUM_NUMBER.search(query)
+        album_hits = list()
+        if match:
+            number = int(match.group(1))
+            album_hits.append({'album': {
+                'albumId': f"B{number:09d}",
+                'name': f"Album {number}",
+                'albumArtist': get_artist(number * ALBUM_SIZE),
+            }})
+        return {'song_hits': hits, 'album_hits': album_hits, 'artist_hits': []}
+
+    def get_album_info(self, album_id, include_tracks=True):
+        self._call("get_album_info")
+        number = int(album_id[1:])
+        first = number * ALBUM_SIZE
+        return {
+            'albumId': album_id,
+            'name': f"Album {number}",
+            'tracks': [
+                get_store_track(track) for track in range(first, first + ALBUM_SIZE)
+            ] if include_tracks else [],
+        }
+
+    def get_all_playlists(self, incremental=False, include_deleted=None,
+                          updated_after=None):
+        self._call("get_all_playlists")
+        return [dict(playlist) for playlist in self.playlists.values()]
+
+    def create_playlist(self, name, description=None, public=False):
+        self._call("create_playlist")
+        playlist_id = f"playlist-{len(self.playlists)}"
+        self.playlists[playlist_id] = {
+            'id': playlist_id, 'name': name, 'shareToken': None,
+            'accessControlled': not public, 'type': 'USER_GENERATED',
+        }
+        return playlist_id
+
+    def add_songs_to_playlist(self, playlist_id, song_ids):
+        self._call("add_songs_to_playlist")
+        if isinstance(song_ids, str):
+            song_ids = [song_ids]
+        self.added[playlist_id] = self.added[playlist_id] + len(song_ids)
+        return list(song_ids)
+
+    def get_shared_playlist_contents(self, share_token):
+        self._call("get_shared_playlist_contents")
+        for playlist in self.playlists.values():
+            if playlist['shareToken'] == share_token:
+                return self._get_entries(playlist['id'])
+        raise CallFailure("404 Not Found")
+
+    def get_all_user_playlist_contents(self):
+        self._call("get_all_user_playlist_contents")
+        return [
+            dict(playlist, tracks=self._get_entries(playlist['id']))
+            for playlist in self.playlists.values()
+        ]
+
+    def _get_entries(self, playlist_id):
+        """The entries of a playlist. New playlists seem empty."""
+        if playlist_id != 'bench':
+            return list()
+        return [
+            {'track': get_store_track(number)}
+            for number in range(self.playlist_size)
+        ]
+
+    def get_top_songs(self):
+        self._call("get_top_songs")
+        return [get_store_track(number) for number in range(self.playlist_size)]
+
+
+class FakeTokenManager(object):
+    """Stands in for spotipyutil.TokenManager."""
+
+    def get_access_token(self, as_dict=False, check_cache=True):
+        return "bench-token"
+
+
+def install():
+    """Install the fake ``spotipy`` and ``gmusicapi`` modules."""
+    spotipy = types.ModuleType("spotipy")
+    spotipy.Spotify = FakeSpotify
+    spotipy.SpotifyException = SpotifyException
+
+    gmusicapi = types.ModuleType("gmusicapi")
+    gmusicapi.Mobileclient = FakeMobileclient
+
+    sys.modules["spotipy"] = spotipy
+    sys.modules["gmusicapi"] = gmusicapi
+
+
+def get_call_counts():
+    """The number of calls made to each fake method, by every client."""
+    counts = collections.Counter()
+    for client in FakeSpotify.instances:
+        counts.update({f"Spotify.{k}": v for k, v in client.calls.items()})
+    for client in FakeMobileclient.instances:
+        counts.update({f"Mobileclient.{k}": v for k, v in client.calls.items()})
+    return dict(sorted(counts.items()))
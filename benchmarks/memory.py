@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure how the memory used by the spotifyscrape commands grows with the
+number of tracks.
+
+Every command should stream its rows, so its memory should not grow with the
+size of the playlist. Each command is run at each size in a new interpreter,
+against the fakes in ``fakes.py``, and the peak memory allocated by Python
+(tracemalloc) is printed along with the growth per track between the
+smallest and the largest size.
+
+Usage: python benchmarks/memory.py [--sizes 1000,10000,100000]
+           [--commands export,export-tracks,import,...] [--jobs N]
+           [--max-bytes-per-track N]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import offline
+
+SIZES = [1000, 10000, 100000]
+
+
+def run_scenario(command, size, jobs):
+    """
+    Run one command in this process, with the output discarded, and print
+    the peak traced memory as JSON.
+    """
+    import tracemalloc
+    import fakes
+
+    fakes.install()
+    run = offline.prepare_command(command, size, jobs, os.environ["HOME"])
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr = offline.Sink()
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    sys.stdout = stdout
+    json.dump({'command': command, 'size': size, 'peak_bytes': peak}, stdout)
+
+
+def run_in_subprocess(command, size, args):
+    """Run a scenario in a new interpreter with an empty home directory."""
+    benchmarks = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, ".spotifyscrape"), "w") as config_file:
+            config_file.write(
+                offline.CONFIG.format(cache=os.path.join(home, "cache"))
+            )
+
+        env = dict(os.environ)
+        env["HOME"] = home
+        env["PYTHONPATH"] = os.pathsep.join(
+            [args.source, benchmarks, env.get("PYTHONPATH", "")]
+        )
+
+        process = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__),
+                "--scenario", f"{command}:{size}", "--jobs", str(args.jobs),
+            ],
+            env=env, stdout=subprocess.PIPE, universal_newlines=True
+        )
+
+    if process.returncode:
+        return {'command': command, 'size': size, 'error': process.returncode}
+
+    return json.loads(process.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in SIZES),
+        help="Comma separated numbers of tracks."
+    )
+    parser.add_argument(
+        "--commands", default=",".join(offline.COMMANDS),
+        help="Comma separated commands to run: " + ", ".join(offline.COMMANDS)
+    )
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument(
+        "--max-bytes-per-track", type=float,
+        help="Exit with an error if any command grows by more than this."
+    )
+    parser.add_argument(
+        "--source", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        help="The directory that contains the spotifyscrape package."
+    )
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        command, size = args.scenario.split(":")
+        run_scenario(command, int(size), args.jobs)
+        return
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    print(
+        f"{'command':<18} " + " ".join(f"{size:>10}" for size in sizes) +
+        f" {'bytes/track':>12}"
+    )
+
+    failed = False
+    for command in args.commands.split(","):
+        results = [run_in_subprocess(command, size, args) for size in sizes]
+        errors = [result for result in results if 'error' in result]
+        if errors:
+            print(f"{command:<18} failed ({errors[0]['error']})")
+            failed = True
+            continue
+
+        peaks = [result['peak_bytes'] for result in results]
+        growth = 0.0
+        if len(sizes) > 1:
+            growth = (peaks[-1] - peaks[0]) / (sizes[-1] - sizes[0])
+
+        flag = ""
+        if args.max_bytes_per_track is not None and \
+                growth > args.max_bytes_per_track:
+            flag = "  TOO MUCH"
+            failed = True
+
+        print(
+            f"{command:<18} " +
+            " ".join(f"{peak // 1024:>8}KB" for peak in peaks) +
+            f" {growth:>12.1f}{flag}"
+        )
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
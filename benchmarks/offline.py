@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the spotifyscrape commands against fake Spotify and All Access APIs.
+
+No network access or credentials are needed. ``spotipy.Spotify`` and
+``gmusicapi.Mobileclient`` are replaced by the in-process doubles in
+``fakes.py``, which can add latency to every call and throttle every Nth call.
+
+Each command is run at each size in a new interpreter, with an empty cache
+directory, and the throughput, peak memory (max RSS) and API call counts are
+printed. Save the results with ``--output`` and pass them to ``--compare`` on
+a later run to find regressions.
+
+Usage: python benchmarks/offline.py [--sizes 100,10000,100000]
+           [--commands export,export-tracks,import,gmusic-export,...]
+           [--latency MS] [--throttle-every N] [--jobs N]
+           [--output FILE] [--compare FILE] [--tolerance PERCENT]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+COMMANDS = [
+    "export", "export-tracks", "export-library", "import", "gmusic-export",
+    "gmusic-export-all"
+]
+SIZES = [100, 10000, 100000]
+
+CONFIG = """
+[All Access]
+client-id = bench
+search-rate = 0
+[Spotify]
+username = bench
+client-id = bench
+client-secret = bench
+rate = 0
+[Cache]
+path = {cache}
+"""
+
+
+class Sink(object):
+    """A file that counts and discards everything written to it."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, text):
+        self.bytes = self.bytes + len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def prepare_command(command, size, jobs, workdir):
+    """
+    Create the input of a command and return a function that runs it, so
+    only the command itself is timed.
+    """
+    import fakes
+    from spotifyscrape import spotify, allaccess
+
+    spotify.get_token_manager = lambda *args, **kwargs: fakes.FakeTokenManager()
+
+    if command == "export":
+        fakes.FakeSpotify.playlist_size = size
+
+        def run():
+            spotify.exportplaylist(
+                "https://open.spotify.com/playlist/bench", jobs=jobs
+            )
+
+    elif command == "export-library":
+        fakes.FakeSpotify.playlist_size = size
+
+        def run():
+            spotify.exportlibrary(jobs=jobs)
+
+    elif command == "export-tracks":
+        tracklist = os.path.join(workdir, "tracks.txt")
+        with open(tracklist, "w") as tracklist_file:
+            for number in range(size):
+                tracklist_file.write(
+                    f"spotify:track:{fakes.get_track_id(number)}\n"
+                )
+
+        def run():
+            spotify.exporttracks(tracklist, jobs=jobs)
+
+    elif command == "import":
+        playlist = os.path.join(workdir, "playlist.csv")
+        with open(playlist, "w") as playlist_file:
+            playlist_file.write("# Playlist: Imported\n")
+            playlist_file.write('"Track","Artist","Album"\n')
+            for number in range(size):
+                track = fakes.get_store_track(number)
+                playlist_file.write(
+                    f'"{track["title"]}","{track["artist"]}","{track["album"]}"\n'
+                )
+
+        def run():
+            with open(playlist, "r") as playlist_file:
+                sys.stdin = playlist_file
+                for line in allaccess.allaccessimport(jobs=jobs):
+                    sys.stdout.write(line)
+
+    elif command == "gmusic-export":
+        fakes.FakeMobileclient.playlist_size = size
+
+        def run():
+            for line in allaccess.allaccessexport("Bench"):
+                sys.stdout.write(line + "\n")
+
+    elif command == "gmusic-export-all":
+        fakes.FakeMobileclient.playlist_size = size
+        output_dir = os.path.join(workdir, "export")
+
+        def run():
+            for line in allaccess.allaccessexport(
+                    None, all_playlists=True, output_dir=output_dir):
+                sys.stdout.write(line + "\n")
+
+    else:
+        raise ValueError(f"Unknown command {command}")
+
+    return run
+
+
+def run_scenario(command, size, args):
+    """
+    Run one command in this process, with the output discarded, and print
+    the result as JSON. Called in a new interpreter by run_in_subprocess.
+    """
+    import resource
+    import fakes
+
+    fakes.install()
+    fakes.FakeSpotify.latency = args.latency / 1000
+    fakes.FakeSpotify.throttle_every = args.throttle_every
+    fakes.FakeMobileclient.latency = args.latency / 1000
+    fakes.FakeMobileclient.throttle_every = args.throttle_every
+
+    run = prepare_command(command, size, args.jobs, os.environ["HOME"])
+
+    stdout = sys.stdout
+    sink = Sink()
+    sys.stdout = sys.stderr = sink
+
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+
+    sys.stdout = stdout
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss = max_rss // 1024
+
+    json.dump({
+        'command': command,
+        'size': size,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(size / elapsed, 1) if elapsed else None,
+        'max_rss_kb': max_rss,
+        'output_bytes': sink.bytes,
+        'calls': fakes.get_call_counts(),
+    }, stdout)
+
+
+def run_in_subprocess(command, size, args):
+    """Run a scenario in a new interpreter with an empty home directory."""
+    benchmarks = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as home:
+        with open(os.path.join(home, ".spotifyscrape"), "w") as config_file:
+            config_file.write(CONFIG.format(cache=os.path.join(home, "cache")))
+
+        env = dict(os.environ)
+        env["HOME"] = home
+        env["PYTHONPATH"] = os.pathsep.join(
+            [args.source, benchmarks, env.get("PYTHONPATH", "")]
+        )
+
+        process = subprocess.run(
+            [
+                sys.executable, os.path.abspath(__file__),
+                "--scenario", f"{command}:{size}",
+                "--latency", str(args.latency),
+                "--throttle-every", str(args.throttle_every),
+                "--jobs", str(args.jobs),
+            ],
+            env=env, stdout=subprocess.PIPE, universal_newlines=True
+        )
+
+    if process.returncode:
+        return {'command': command, 'size': size, 'error': process.returncode}
+
+    return json.loads(process.stdout)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the change from the baseline results. Returns True if any command
+    got slower or used more memory by more than ``tolerance`` percent.
+    """
+    previous = {
+        (result['command'], result['size']): result for result in baseline
+    }
+    regressed = False
+
+    print()
+    print(f"{'command':<18} {'size':>7} {'throughput':>11} {'max rss':>9}")
+    for result in results:
+        before = previous.get((result['command'], result['size']))
+        if not before or 'error' in result or 'error' in before:
+            continue
+
+        speed = get_change(before['rows_per_second'], result['rows_per_second'])
+        memory = get_change(before['max_rss_kb'], result['max_rss_kb'])
+        flag = ""
+        if speed < -tolerance or memory > tolerance:
+            flag = "  REGRESSION"
+            regressed = True
+
+        print(
+            f"{result['command']:<18} {result['size']:>7} {speed:>+10.1f}% "
+            f"{memory:>+8.1f}%{flag}"
+        )
+
+    return regressed
+
+
+def get_change(before, after):
+    """The change from ``before`` to ``after`` in percent."""
+    if not before:
+        return 0.0
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in SIZES),
+        help="Comma separated numbers of tracks."
+    )
+    parser.add_argument(
+        "--commands", default=",".join(COMMANDS),
+        help="Comma separated commands to run: " + ", ".join(COMMANDS)
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0,
+        help="Milliseconds added to every API call."
+    )
+    parser.add_argument(
+        "--throttle-every", type=int, default=0,
+        help="Throttle every Nth API call with an HTTP 429."
+    )
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--output", help="Save the results as JSON.")
+    parser.add_argument(
+        "--compare", help="Compare with the results saved by --output."
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=10,
+        help="The change in percent that is reported as a regression."
+    )
+    parser.add_argument(
+        "--source", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        help="The directory that contains the spotifyscrape package."
+    )
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        command, size = args.scenario.split(":")
+        run_scenario(command, int(size), args)
+        return
+
+    results = list()
+    print(
+        f"{'command':<18} {'size':>7} {'seconds':>8} {'rows/s':>10} "
+        f"{'max rss kb':>10}  calls"
+    )
+    for size in [int(size) for size in args.sizes.split(",")]:
+        for command in args.commands.split(","):
+            result = run_in_subprocess(command, size, args)
+            results.append(result)
+
+            if 'error' in result:
+                print(f"{command:<18} {size:>7} failed ({result['error']})")
+                continue
+
+            calls = ", ".join(f"{k}={v}" for k, v in result['calls'].items())
+            print(
+                f"{command:<18} {size:>7} {result['seconds']:>8.2f} "
+                f"{result['rows_per_second']:>10.0f} "
+                f"{result['max_rss_kb']:>10}  {calls}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measure the cold-start time of each spotifyscrape command.
+
+Each command is run with ``--help`` in a new interpreter several times and
+the median wall-clock time is printed, along with the backend libraries that
+were imported. Use ``--source`` to measure another checkout, for example one
+of an older revision, and compare the results.
+
+Usage: python benchmarks/startup.py [--runs N] [--source DIR]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+COMMANDS = [
+    [],
+    ["gmusic", "import"],
+    ["gmusic", "export"],
+    ["gmusic", "login"],
+    ["spotify", "export"],
+    ["spotify", "export-tracks"],
+    ["spotify", "export-library"],
+    ["spotify", "login"],
+    ["transfer"],
+    ["batch"],
+]
+
+BACKENDS = ["spotipy", "gmusicapi", "requests"]
+
+PROBE = """
+import sys
+sys.argv = ["spotifyscrape"] + sys.argv[1:]
+from spotifyscrape.spotifyscrape import main
+try:
+    main()
+except SystemExit:
+    pass
+loaded = [name for name in {backends!r} if name in sys.modules]
+sys.stderr.write("LOADED:" + ",".join(loaded) + "\\n")
+"""
+
+
+def run_once(command, source):
+    """Run one command and return the elapsed time and loaded backends."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = source + os.pathsep + env.get("PYTHONPATH", "")
+
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", PROBE.format(backends=BACKENDS)] +
+        command + ["--help"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    elapsed = time.perf_counter() - start
+
+    loaded = ""
+    for line in process.stderr.splitlines():
+        if line.startswith("LOADED:"):
+            loaded = line[len("LOADED:"):]
+
+    return elapsed, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--source", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        help="The directory that contains the spotifyscrape package."
+    )
+    args = parser.parse_args()
+
+    print(f"{'command':<24} {'median ms':>10} {'min ms':>8}  backends loaded")
+    for command in COMMANDS:
+        times = list()
+        loaded = ""
+        for _ in range(args.runs):
+            elapsed, loaded = run_once(command, args.source)
+            times.append(elapsed * 1000)
+
+        name = " ".join(command) or "(top level)"
+        print(
+            f"{name:<24} {statistics.median(times):>10.1f} {min(times):>8.1f}  "
+            f"{loaded or '-'}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -27,6 +27,7 @@ setup(
         "argcomplete",
         "argh",
         "gmusicapi",
+        "requests",
         "spotipy",
     ],
     entry_points = {
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Resolve the rows of an album with one album lookup instead of a search each"""
+
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+from .searchcache import normalize_term
+
+# The number of fetched albums kept in memory
+MAX_ALBUMS = 1000
+
+
+def get_album_key(trackinfo):
+    """The normalized (artist, album) of a CSV row, or None if it has none."""
+    if len(trackinfo) < 3 or not trackinfo[1] or not trackinfo[2]:
+        return None
+
+    return normalize_term(trackinfo[1]), normalize_term(trackinfo[2])
+
+
+def count_albums(items, window, get_row=lambda item: item):
+    """
+    Pair each item with the number of rows from the same album within its
+    window of ``window`` rows. ``get_row`` gets the CSV row of an item.
+    """
+    buffer = list()
+
+    def drain():
+        counts = Counter(get_album_key(get_row(item)) for item in buffer)
+        for item in buffer:
+            yield item, counts[get_album_key(get_row(item))]
+        buffer.clear()
+
+    for item in items:
+        buffer.append(item)
+        if len(buffer) >= window:
+            yield from drain()
+
+    yield from drain()
+
+
+class AlbumIndex(object):
+    """
+    Finds the store IDs of tracks by looking up their album.
+
+    The album is found with one search and its track listing is fetched with
+    ``get_album_info``. Titles are then matched locally, so every row from
+    the same album is resolved by the same two calls. The last
+    ``max_albums`` albums are kept, so nearby rows never fetch an album
+    twice, and the index can be shared between threads. The tracks of every
+    album are added to ``catalog``, if given, which still finds them once
+    the album is forgotten.
+    """
+
+    def __init__(self, api, catalog=None, max_albums=MAX_ALBUMS):
+        self.api = api
+        self.catalog = catalog
+        self.max_albums = max_albums
+        self.albums = OrderedDict()
+        self.locks = dict()
+        self.lock = threading.Lock()
+        self.fetched = 0
+        self.hits = 0
+
+    def is_known(self, trackinfo):
+        """Check if the album of a row was already fetched."""
+        return get_album_key(trackinfo) in self.albums
+
+    def find(self, trackinfo):
+        """Get the store ID of a row from its album, or None."""
+        key = get_album_key(trackinfo)
+        if key is None:
+            return None
+
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+
+        with lock:
+            tracks = self.albums.get(key)
+            if tracks is None:
+                tracks = self._fetch(trackinfo[1], trackinfo[2])
+                self._keep(key, tracks)
+
+        store_id = tracks.get(normalize_term(trackinfo[0]))
+        if store_id:
+            with self.lock:
+                self.hits = self.hits + 1
+        return store_id
+
+    def _keep(self, key, tracks):
+        """Remember an album, forgetting the oldest ones past the limit."""
+        with self.lock:
+            self.albums[key] = tracks
+            while len(self.albums) > self.max_albums:
+                old_key, _ = self.albums.popitem(last=False)
+                self.locks.pop(old_key, None)
+
+    def _fetch(self, artist, album):
+        """Get the titles and store IDs of an album's tracks."""
+        try:
+            results = self.api.search(f"{album} {artist}")
+            album_ids = [
+                hit['album']['albumId'] for hit in results.get('album_hits', [])
+                if normalize_term(hit['album'].get('name', "")) ==
+                normalize_term(album)
+            ]
+            if not album_ids:
+                return dict()
+
+            info = self.api.get_album_info(album_ids[0], include_tracks=True)
+        except Exception as error:
+            logging.debug(f"Unable to get album {album} by {artist}: {error}")
+            return dict()
+
+        with self.lock:
+            self.fetched = self.fetched + 1
+        if self.catalog:
+            self.catalog.add_tracks(info.get('tracks', []))
+
+        tracks = dict()
+        for track in info.get('tracks', []):
+            title = normalize_term(track.get('title', ""))
+            if title and track.get('storeId'):
+                tracks.setdefault(title, track['storeId'])
+        return tracks
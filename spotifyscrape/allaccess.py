@@ -4,52 +4,107 @@
 """Module to work with Google Play All Access playlists"""
 
 import csv
+import itertools
 import os.path
 import logging
 import sys
 import re
+from collections import Counter
+from hashlib import sha1
 from urllib.parse import unquote
 
-from .config import read_config
+from . import profiling
+from .albums import AlbumIndex, count_albums
+from .catalog import CatalogIndex, get_normalized_term, rank_tracks
+from .config import read_config, get_cache_path, get_default
+from .importoptions import ImportOptions
+from .journal import ImportJournal, FINAL_RESULTS, row_digest, row_key
+from .mutations import MutationBuffer
+from .parallel import imap_ordered
+from .plan import PlanWriter, read_plan
+from .playlistfile import read_playlist
+from .playlistindex import PlaylistIndex
+from .ratelimit import RateLimiter, ThrottledClient
+from .searchcache import SearchCache, normalize_term
+from .sessions import get_session
+from .track import Track
+from .trackindex import TrackIndex
+from .trackmap import TrackMap
 from argh import arg, named, CommandError
-from gmusicapi import Mobileclient
 
 APP_CONFIG_FILE = os.path.expanduser("~/.spotifyscrape")
 
-
-@arg(
-    '--client-id', help='A unique ID for this client',
-    default=read_config().get("All Access", "client-id")
+CLIENT_ID_ARG = arg(
+    '--client-id', help='A unique ID for this client'
+)
+DRY_RUN_ARG = arg(
+    '--dry-run', help='Do not make any actual changes in All Access.'
+)
+BATCH_SIZE_ARG = arg(
+    '--batch-size', type=int,
+    help='The number of songs to add to the playlist in one request.'
+)
+BATCH_INTERVAL_ARG = arg(
+    '--batch-interval', type=float,
+    help='The maximum number of seconds to wait before ' +
+         'adding pending songs to the playlist.'
+)
+JOBS_ARG = arg(
+    '--jobs', type=int,
+    help='The number of searches to run at the same time.'
+)
+SEARCH_RATE_ARG = arg(
+    '--search-rate', type=float,
+    help='The starting number of All Access requests per second. The rate ' +
+         'is lowered automatically when the service throttles requests. ' +
+         'Use 0 for no limit.'
+)
+NO_CACHE_ARG = arg(
+    '--no-cache', help='Do not read or update the search cache ' +
+                       'or the catalog index.'
 )
+ALLOW_REPEATS_ARG = arg(
+    '--allow-repeats', help='Add a track as many times as it appears in the ' +
+                            'input, instead of skipping it after the first time.'
+)
+RESUME_ARG = arg(
+    '--resume', help='Skip the rows that were completed by an earlier, ' +
+                     'interrupted import of the same playlist.'
+)
+
+
+@arg('playlist_name', nargs='?',
+     help="The name or share URL of the playlist to export.")
+@CLIENT_ID_ARG
 @arg("--shared",
      help="If set, the playlist name is treated as a shared playlist. "
           "If you use the Share URL, this is automatically set.")
+@arg("--all", dest="all_playlists",
+     help="Export every playlist, and Thumbs Up, to its own file.")
+@arg("--output-dir",
+     help="The directory the files of --all are written to.")
 @named('export')
-def allaccessexport(playlist_name, client_id=None, shared=False):
-    if not client_id:
-        raise CommandError(
-            "client-id must be provided as either command-line " +
-            "argument or in the application configuration file."
-        )
+def allaccessexport(playlist_name, client_id=None, shared=False,
+                    all_playlists=False, output_dir="."):
+    if not playlist_name and not all_playlists:
+        raise CommandError("Give a playlist name, or --all to export every playlist.")
 
-    api = Mobileclient(debug_logging=False, validate=False)
-    logged_in = api.oauth_login(client_id)
-    if not logged_in:
-        raise CommandError('Error. Unable to login to Google Music All Access.')
+    api = login(client_id)
+
+    if all_playlists:
+        yield from export_all(api, output_dir)
+        return
 
     if playlist_name.startswith("http"):
         shared = True
 
     if playlist_name == "Thumbs Up":
         topsongs = api.get_top_songs()
-        tp2 = list()
-        for song in topsongs:
-            tp2.append({'track': song})
 
         playlist = {
             'name': "Thumbs Up",
             'shareToken': '',
-            'tracks': tp2
+            'tracks': ({'track': song} for song in topsongs)
         }
     elif shared:
         pattern = r"https?://play.google.com/music/playlist/(.+)"
@@ -68,163 +123,598 @@ def allaccessexport(playlist_name, client_id=None, shared=False):
             'tracks': songs
         }
     else:
-        playlist = [x for x in api.get_all_user_playlist_contents() if x['name'] == playlist_name]
+        playlist = open_playlist_index(api).find(playlist_name)
         if len(playlist) == 1:
-            playlist = playlist[0]
+            playlist = dict(playlist[0])
+            playlist['tracks'] = get_playlist_tracks(api, playlist)
         else:
             return "Playlist not found"
 
-    tracks = playlist['tracks']
-    playlist = playlist
-
     yield f"# Playlist: {playlist['name']}"
     yield f"# Description: from https://play.google.com/music/playlist/{playlist['shareToken']}"
     yield 'Track,Artist,Album'
-    for track in tracks:
-        if 'track' in track:
-            track = track['track']
-            yield f"{track['title']},{track['artist']},{track['album']}"
+    for track in get_entry_tracks(playlist['tracks']):
+        yield f"{track.title},{track.artist},{track.album}"
+
+
+def get_entry_tracks(entries):
+    """
+    Convert playlist entries to Tracks, one at a time. Entries without track
+    details are reported and skipped.
+    """
+    for entry in entries:
+        if 'track' in entry:
+            yield Track.from_store(entry['track'])
         else:
-            sys.stderr.write(f"Unable to get track details: {track}\n")
+            sys.stderr.write(f"Unable to get track details: {entry}\n")
+
+
+def export_all(api, output_dir):
+    """
+    Write every user playlist, and Thumbs Up, to its own CSV file in
+    ``output_dir``. Yields the progress messages.
+
+    The contents of every playlist are downloaded in one pass. Each playlist
+    is written, and then dropped, before the next one.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    used_names = set()
+    exported = 0
+
+    playlists = api.get_all_user_playlist_contents()
+    playlists.reverse()
+    while playlists:
+        playlist = playlists.pop()
+        path = get_export_path(
+            output_dir, playlist['name'], playlist['id'], used_names
+        )
+        # Pop the tracks, so they are dropped as soon as they are written
+        written = write_playlist_csv(
+            path, playlist['name'], playlist.get('shareToken') or "",
+            playlist.pop('tracks', [])
+        )
+        exported = exported + 1
+        yield f"Wrote {written} tracks of {playlist['name']} to {path}"
 
+    path = get_export_path(output_dir, "Thumbs Up", "thumbs-up", used_names)
+    written = write_playlist_csv(
+        path, "Thumbs Up", "", ({'track': song} for song in api.get_top_songs())
+    )
+    yield f"Wrote {written} tracks of Thumbs Up to {path}"
 
+    yield f"Exported {exported} playlists and Thumbs Up to {output_dir}."
+
+
+def get_export_path(output_dir, name, playlist_id, used_names):
+    """
+    Get a unique file name for an exported playlist. Playlists with the same
+    name get the start of their ID added.
+    """
+    base = re.sub(r"[^\w\-. ]+", "_", name).strip(" .") or "playlist"
+    if base.casefold() in used_names:
+        base = f"{base}-{playlist_id[:8]}"
+    used_names.add(base.casefold())
+
+    return os.path.join(output_dir, base + ".csv")
+
+
+def write_playlist_csv(path, name, share_token, tracks):
+    """
+    Write the tracks of a playlist to a CSV file, in the format read by the
+    import command. Returns the number of tracks written.
+    """
+    written = 0
+    with open(path, "w", newline="") as playlist_file:
+        playlist_file.write(f"# Playlist: {name}\n")
+        playlist_file.write(
+            f"# Description: from https://play.google.com/music/playlist/{share_token}\n"
+        )
+        writer = profiling.csv_writer(playlist_file, quoting=csv.QUOTE_ALL)
+        writer.writerow(["Track", "Artist", "Album"])
+        for track in get_entry_tracks(tracks):
+            writer.writerow(track.to_row())
+            written = written + 1
+
+    return written
+
+
+@CLIENT_ID_ARG
+@DRY_RUN_ARG
 @arg(
-    '--client-id', help='A unique ID for this client',
-    default=read_config().get("All Access", "client-id")
+    '--playlist', help='The CSV or JSON lines file that contains the ' +
+                       'tracks to add. The file name (without extension) ' +
+                       'will become the playlist name.'
 )
+@BATCH_SIZE_ARG
+@BATCH_INTERVAL_ARG
+@JOBS_ARG
+@SEARCH_RATE_ARG
+@NO_CACHE_ARG
 @arg(
-    '--dry-run', help='Do not make any actual changes in All Access.'
+    '--warm-cache', help='Only search for the tracks and update the search ' +
+                         'cache. Implies --dry-run.'
+)
+@arg(
+    '--purge-cache', help='Remove everything from the search cache first.'
+)
+@ALLOW_REPEATS_ARG
+@RESUME_ARG
+@arg(
+    '--plan', help='Search for the tracks and write the results to this ' +
+                   'plan file, without changing any playlists.'
 )
 @arg(
-    '--playlist', help='The CSV file that contains the tracks to add. ' +
-                       'The file name (without extension) will become the playlist name.'
+    '--apply', help='Add the tracks in a plan file written by --plan, ' +
+                    'without searching again.'
 )
 @named('import')
-def allaccessimport(playlist=None, client_id=None, dry_run=False):
+def allaccessimport(playlist=None, client_id=None, dry_run=False,
+                    batch_size=None, batch_interval=None, jobs=None,
+                    search_rate=None, no_cache=False, warm_cache=False,
+                    purge_cache=False, allow_repeats=False, resume=False,
+                    plan=None, apply=None):
     """
     Exports a Spotify playlist to stdout or csv.
     """
 
-    if not client_id:
-        raise CommandError(
-            "client-id must be provided as either command-line " +
-            "argument or in the application configuration file."
-        )
+    if plan and apply:
+        raise CommandError("--plan and --apply cannot be used together.")
+
+    if warm_cache or plan:
+        dry_run = True
 
     playlist_name = playlist
-    playlist_description = ""
     if playlist:
         playlist_name = os.path.basename(playlist_name)
         playlist_name = os.path.splitext(playlist_name)[0]
     logging.debug(f"Playlist name will be: {playlist_name}")
 
-    api = Mobileclient(debug_logging=False, validate=False)
-    logged_in = api.oauth_login(client_id)
-    if not logged_in:
-        raise CommandError('Error. Unable to login to Google Music All Access.')
+    api = login(client_id, search_rate, jobs)
+    settings = dict(
+        dry_run=dry_run, batch_size=batch_size, batch_interval=batch_interval,
+        jobs=jobs, allow_repeats=allow_repeats, resume=resume
+    )
+
+    if apply:
+        yield from apply_plan(api, apply, ImportOptions(**settings))
+        return
+
+    header = {'name': playlist_name, 'description': ""}
+    stream = open(playlist, "r", newline="") if playlist else sys.stdin
+
+    def read_rows():
+        """Read the track rows, picking up the playlist header on the way."""
+        try:
+            yield from read_playlist(stream, header)
+        except ValueError as error:
+            raise CommandError(f"Unable to read the playlist: {error}")
+        finally:
+            if playlist:
+                stream.close()
+
+    options = open_import_options(no_cache, **settings)
+    if options.cache and purge_cache:
+        options.cache.purge()
+    plan_writer = None
+
+    try:
+        rows = read_rows()
+        if plan:
+            # Read up to the first row, so the plan starts with the playlist
+            # name and description from the file
+            first_row = next(rows, None)
+            if first_row is not None:
+                rows = itertools.chain([first_row], rows)
+            plan_writer = PlanWriter(plan, header)
+
+        yield from import_rows(api, rows, header, options, plan=plan_writer)
+        yield from options.get_cache_stats()
+    finally:
+        if plan_writer:
+            plan_writer.close()
+        options.close()
+
+    if plan_writer:
+        yield f"Plan of {plan_writer.rows} tracks written to {plan}."
+
+
+def import_rows(api, rows, header, options, plan=None, resolved=None):
+    """
+    Search for each row and add the matches to a playlist, using the caches
+    and settings of the ImportOptions ``options``. Yields the progress
+    messages.
+
+    ``rows`` is an iterable of [Track, Artist, Album] lists, optionally
+    followed by the Spotify ID and ISRC. ``header`` is a dict with the
+    playlist 'name' and 'description'. It is read when the first row
+    arrives, so ``rows`` may fill it in lazily.
+
+    The result of every row is written to the PlanWriter ``plan``, if given.
+    ``resolved`` maps row keys to the (store ID, result) of a plan that is
+    being applied. If it is given, nothing is searched.
+    """
+    cache, track_map, catalog = options.cache, options.track_map, options.catalog
+    dry_run, resume = options.dry_run, options.resume
+    batch_size, batch_interval = options.batch_size, options.batch_interval
+    jobs, allow_repeats = options.jobs, options.allow_repeats
+    album_min_rows = get_default(None, "All Access", "album-min-rows", int)
+    album_window = get_default(None, "All Access", "album-window", int)
+    albums = AlbumIndex(api, catalog) \
+        if album_min_rows and resolved is None else None
 
     playlist_ref = None
     currenttracks = None
+    mutations = None
+    journal = None
 
     failed_tracks = list()
     songs_added = 0
     total = 0
+    resumed = 0
+
+    def keyed_rows():
+        """Pair each row with its journal key. Opens the journal first."""
+        nonlocal journal
+        occurrences = Counter()
+        for trackinfo in rows:
+            if journal is None and not dry_run and header['name']:
+                journal = open_journal(header['name'], resume)
+
+            # Count by digest, which is smaller than the row itself
+            digest = row_digest(trackinfo)
+            occurrences[digest] += 1
+            yield trackinfo, row_key(trackinfo, occurrences[digest], digest)
+
+    def resolve(item):
+        """Search for a row. Runs on a worker thread when jobs > 1."""
+        (trackinfo, key), album_rows = item
+        if is_header_row(trackinfo):
+            return None
+
+        if journal:
+            record = journal.get(key)
+            if record and record.get('result') in ("OK",) + FINAL_RESULTS:
+                return record.get('id'), record['result']
+
+        if resolved is not None:
+            # Dupes are checked again, the playlist may have changed
+            store_id, result = resolved.pop(key, (None, "Not Planned"))
+            return (store_id, "OK") if store_id else (None, result)
+
+        spotify_id, isrc = get_row_ids(trackinfo)
+        if track_map and (spotify_id or isrc):
+            store_id = track_map.get(spotify_id, isrc)
+            if store_id:
+                return store_id, "OK"
+
+        search_term = get_search_term(trackinfo)
+        store_id = catalog.find(trackinfo) if catalog else None
+        if store_id:
+            result = store_id, "OK"
+        else:
+            result = cache.get(search_term) if cache else None
+        if not result:
+            result = find_in_album(trackinfo, album_rows) or \
+                find_track(api, search_term, trackinfo, catalog)
+            if cache:
+                cache.put(search_term, *result)
+
+        if track_map and result[0]:
+            track_map.put(result[0], spotify_id, isrc)
+        return result
+
+    def find_in_album(trackinfo, album_rows):
+        """Find a row in its album, if enough rows share the album."""
+        if albums and (album_rows >= album_min_rows or albums.is_known(trackinfo)):
+            store_id = albums.find(trackinfo)
+            if store_id:
+                return store_id, "OK"
+        return None
+
+    def on_added(added_rows):
+        """Record the rows in each committed batch."""
+        if journal:
+            journal.committed([key for _, key in added_rows])
 
-    stream = open(playlist, "rb") if playlist else sys.stdin
+    try:
+        items = count_albums(
+            keyed_rows(), album_window, get_row=lambda item: item[0]
+        )
+        for ((trackinfo, key), _), result in imap_ordered(resolve, items, jobs=jobs):
+            if mutations is None:
+                playlist_name = header['name']
+                if not playlist_name:
+                    raise CommandError(
+                        "A playlist name was not given and it was not found " +
+                        "in the file either. Can't continue."
+                    )
+                else:
+                    if options.playlist_index is None:
+                        options.playlist_index = open_playlist_index(api)
+                    playlist_index = options.playlist_index
+                    with playlist_index.name_lock(playlist_name):
+                        playlist_ref, currenttracks = get_playlist(
+                            api, playlist_name, playlist_index, catalog
+                        )
+                        if not playlist_ref and not dry_run:
+                            sys.stderr.write('Playlist not found. Creating new.\n')
+                            playlist_ref = api.create_playlist(playlist_name, description=header['description'])
+                            playlist_index.add(playlist_ref, playlist_name)
+                    currenttracks = TrackIndex(currenttracks, allow_repeats)
+                    yield f'Going to update playlist {playlist_name} ({playlist_ref})\n'
+                    mutations = MutationBuffer(
+                        api, playlist_ref, batch_size=batch_size,
+                        flush_interval=batch_interval, dry_run=dry_run,
+                        on_added=on_added
+                    )
+
+            if result is None:
+                yield 'Skipping header.'
+                continue
+
+            if journal and journal.is_done(key):
+                resumed = resumed + 1
+                continue
+
+            search_term = get_search_term(trackinfo)
+            total = total + 1
+            newtrackid, error_reason = result
+            if newtrackid and not currenttracks.add(newtrackid):
+                newtrackid, error_reason = None, "Dupe"
+            if journal:
+                journal.resolved(key, newtrackid, error_reason)
+            if plan:
+                plan.add(key, trackinfo, result[0], error_reason)
+            sys.stderr.write(
+                f"Searching {search_term}...{error_reason}\n"
+            )
+            if newtrackid:
+                mutations.add(newtrackid, (trackinfo, key))
+            else:
+                failed_tracks.append(tuple(trackinfo))
+                mutations.flush_if_due()
+
+        if mutations is not None:
+            mutations.flush()
+            songs_added = mutations.added
+            failed_tracks.extend(
+                tuple(trackinfo) for trackinfo, _ in mutations.failed
+            )
+    except BaseException:
+        if journal:
+            journal.close()
+        raise
+
+    if journal:
+        journal.close(remove=mutations is not None and not mutations.failed)
+
+    if resumed:
+        yield f"Skipped {resumed} rows that were completed by an earlier run."
 
-    for input_line in stream:
-        input_line = input_line.strip()
+    yield f"{songs_added} songs added out of {total}. {total - songs_added} Failed."
 
-        # Lazily search the beginning of the file for a Playlist name
-        if input_line.startswith("#"):
-            data = input_line[1:]
-            parts = [x.strip() for x in data.split(":", 1)]
+    if albums:
+        yield f"Albums: {albums.fetched} albums fetched, " \
+            f"{albums.hits} tracks found without searching."
 
-            if len(parts) == 2:
-                if parts[0] == "Playlist":
-                    playlist_name = parts[1]
-                elif parts[0] == "Description":
-                    playlist_description = parts[1]
+    yield "Failed tracks:"
+    for trackinfo in failed_tracks:
+        yield f"  {list(trackinfo)}"
 
-            continue
 
-        if not playlist_ref:
-            if not playlist_name:
-                raise CommandError(
-                    "A playlist name was not given and it was not found " +
-                    "in the file either. Can't continue."
-                )
-            else:
-                playlist_ref, currenttracks = get_playlist(api, playlist_name)
-                if not playlist_ref and not dry_run:
-                    sys.stderr.write('Playlist not found. Creating new.\n')
-                    playlist_ref = api.create_playlist(playlist_name, description=playlist_description)
-                yield f'Going to update playlist {playlist_name} ({playlist_ref})\n'
-
-        trackinfo = list(csv.reader([input_line], quoting=csv.QUOTE_ALL))[0]
-
-        if trackinfo[0] == 'Track' and trackinfo[1] == 'Artist':
-            yield 'Skipping header.'
-            continue
-
-        search_term = f"{trackinfo[0]} {trackinfo[1]}"
-        total = total + 1
-        newtrackid, error_reason = search_track(api, search_term, currenttracks)
-        if newtrackid:
-            if not dry_run:
-                # print(f"Add to {playlist_ref} song {newtrackid}")
-                api.add_songs_to_playlist(playlist_ref, newtrackid)
-            songs_added = songs_added + 1
-        else:
-            failed_tracks.append(trackinfo)
-        sys.stderr.write(
-            f"Searching {search_term}...{error_reason}\n"
+def open_import_options(no_cache=False, **kwargs):
+    """
+    Open the caches and get the ImportOptions of a command. The search cache
+    and the catalog index are not used with ``no_cache``. The other
+    ``kwargs`` are passed to ImportOptions.
+    """
+    return ImportOptions(
+        cache=None if no_cache else open_search_cache(),
+        track_map=open_track_map(),
+        catalog=None if no_cache else open_catalog(),
+        **kwargs
+    )
+
+
+def apply_plan(api, path, options):
+    """
+    Add the tracks of a plan written by ``import --plan`` to its playlist.
+    Yields the progress messages.
+    """
+    try:
+        header, rows, resolved = read_plan(path)
+    except (OSError, ValueError) as error:
+        raise CommandError(f"Unable to read the plan: {error}")
+
+    yield from import_rows(api, rows, header, options, resolved=resolved)
+
+
+def login(client_id, rate=None, jobs=None):
+    """
+    Login to Google Music All Access and return the API client.
+
+    Every call made with the client is limited to ``rate`` requests per
+    second, and retried when it is throttled. The client uses the shared
+    All Access HTTP session, with a connection pool big enough for ``jobs``
+    parallel requests.
+    """
+    from gmusicapi import Mobileclient
+
+    rate = get_default(rate, "All Access", "search-rate", float)
+    max_rate = get_default(None, "All Access", "max-search-rate", float)
+    max_retries = get_default(None, "All Access", "max-retries", int)
+    jobs = get_default(jobs, "All Access", "jobs", int)
+
+    client_id = get_default(client_id, "All Access", "client-id")
+    if not client_id:
+        raise CommandError(
+            "client-id must be provided as either command-line " +
+            "argument or in the application configuration file."
         )
 
-    yield f"{songs_added} songs added out of {total}. {total - songs_added} Failed."
+    api = Mobileclient(debug_logging=False, validate=False)
+    use_session(api, get_session("gmusic", jobs))
+    logged_in = api.oauth_login(client_id)
+    if not logged_in:
+        raise CommandError('Error. Unable to login to Google Music All Access.')
 
-    yield "Failed tracks:"
-    for line in failed_tracks:
-        yield f"  {line}"
+    return ThrottledClient(
+        api, RateLimiter(rate, max_rate=max_rate), max_retries=max_retries
+    )
+
+
+def use_session(api, session):
+    """
+    Make a gmusicapi client send its requests through ``session``.
+
+    gmusicapi has no public way to pass in a session. This relies on the
+    private ``_rsession`` and ``_rsession_setup`` attributes of its session
+    object in gmusicapi 13.0.0, the latest release. The client's own setup,
+    such as turning off SSL verification when asked to, is applied to the
+    session before it is used.
+    """
+    api.session._rsession_setup(session)
+    api.session._rsession = session
+
+
+def open_track_map():
+    """Open the map of Spotify tracks to store IDs."""
+    return TrackMap(get_cache_path("trackmap.sqlite"))
+
+
+def open_catalog():
+    """Open the local index of the catalog tracks we have seen."""
+    return CatalogIndex(get_cache_path("catalog.sqlite"))
+
+
+def open_search_cache():
+    """Open the search cache using the limits in the configuration."""
+    config = read_config()
+    day = 24 * 60 * 60
+    return SearchCache(
+        get_cache_path("search.sqlite"),
+        ttl=config.getfloat("Cache", "search-ttl-days") * day,
+        miss_ttl=config.getfloat("Cache", "search-miss-ttl-days") * day,
+        max_entries=config.getint("Cache", "search-max-entries")
+    )
 
 
-def search_track(api, search_term, currenttracks):
+def is_header_row(trackinfo):
+    """Check if a CSV row is the Track,Artist,Album header."""
+    return len(trackinfo) > 1 and trackinfo[0] == 'Track' and \
+        trackinfo[1] == 'Artist'
+
+
+def get_row_ids(trackinfo):
+    """Get the Spotify ID and ISRC of a CSV row, if it has them."""
+    spotify_id = trackinfo[3] if len(trackinfo) > 3 else None
+    isrc = trackinfo[4] if len(trackinfo) > 4 else None
+    return spotify_id or None, isrc or None
+
+
+def get_search_term(trackinfo):
+    """Build the catalog search term for a CSV row."""
+    return f"{trackinfo[0]} {trackinfo[1]}"
+
+
+def find_track(api, search_term, trackinfo=None, catalog=None):
     """
-    Search for a track in the Google Music catalog.
+    Search for a track in the Google Music catalog, without checking for
+    duplicates. This is safe to call from multiple threads.
+
+    If the CSV row ``trackinfo`` is given, the hits are ranked against its
+    title, artist and album, and a search with no results is retried once
+    without punctuation and featured artists. Every hit is added to
+    ``catalog``.
+
+    Returns a tuple of the store ID (or None) and the result.
     """
 
     try:
-        results = api.search(search_term)
+        hits = search_songs(api, search_term)
+        if not hits and trackinfo:
+            retry_term = get_normalized_term(trackinfo)
+            if retry_term and retry_term != normalize_term(search_term):
+                hits = search_songs(api, retry_term)
     except Exception as error:
         logging.exception(error)
         return None, "Search Failed"
 
-    if len(results['song_hits']) > 0:
-        newtrackid = results['song_hits'][0]['track']['storeId']
+    if catalog:
+        catalog.add_tracks(hits)
 
-        if newtrackid in currenttracks:
-            return None, "Dupe"
-        else:
-            return newtrackid, "OK"
+    if hits and trackinfo:
+        hits = rank_tracks(trackinfo, hits)
+
+    if len(hits) > 0:
+        return hits[0]['storeId'], "OK"
     else:
         return None, "No Results"
 
 
-def get_playlist(api, playlistname):
+def search_songs(api, search_term):
+    """Search the Google Music catalog and return the tracks found."""
+    results = api.search(search_term)
+    return [hit['track'] for hit in results['song_hits'] if 'track' in hit]
+
+
+def open_journal(playlist_name, resume=False):
+    """Open the import journal of a playlist."""
+    digest = sha1(playlist_name.encode("utf-8")).hexdigest()[:16]
+    return ImportJournal(
+        get_cache_path(f"import-{digest}.journal"), resume=resume
+    )
+
+
+def open_playlist_index(api):
+    """Open the local index of the user's playlists."""
+    return PlaylistIndex(api, get_cache_path("playlists.json"))
+
+
+def get_playlist_tracks(api, playlist):
     """
-    Get a playlist from Google Music, searching by name.
+    Get the tracks of a single playlist from the playlist index.
+
+    Public playlists are fetched using their share token. The shared
+    playlist endpoint can return no tracks for a private playlist instead of
+    failing, so private playlists, and public ones that seem empty or fail,
+    are found by downloading the contents of every playlist.
+    """
+    if playlist.get('shareToken') and playlist.get('accessControlled') is False:
+        try:
+            tracks = api.get_shared_playlist_contents(playlist['shareToken'])
+            if tracks:
+                return tracks
+        except Exception as error:
+            logging.debug(f"Unable to get playlist by share token: {error}")
+
+    for user_playlist in api.get_all_user_playlist_contents():
+        if user_playlist['id'] == playlist['id']:
+            return user_playlist['tracks']
+
+    return list()
+
+
+def get_playlist(api, playlistname, index=None, catalog=None):
+    """
+    Get a playlist from Google Music, searching by name. The tracks of the
+    playlist are added to ``catalog``, if given.
 
     Returns a tuple of the playlist and the tracks.
     """
-    playlist = [
-        x for x in api.get_all_user_playlist_contents() if x['name'] ==
-                                                           playlistname
-    ]
+    if index is None:
+        index = open_playlist_index(api)
+
+    playlist = index.find(playlistname)
     currenttracks = list()
 
     if len(playlist) == 1:
-        tracks = playlist[0]['tracks']
-        currenttracks = [x['track']['storeId'] for x in tracks]
+        tracks = get_playlist_tracks(api, playlist[0])
+        if catalog:
+            catalog.add_tracks(x['track'] for x in tracks if 'track' in x)
+        currenttracks = [x['track']['storeId'] for x in tracks if 'track' in x]
 
         playlist = playlist[0]['id']
         sys.stderr.write(
@@ -238,5 +728,7 @@ def get_playlist(api, playlistname):
 
 @named('login')
 def allaccesslogin():
+    from gmusicapi import Mobileclient
+
     api = Mobileclient(debug_logging=False, validate=False)
     api.perform_oauth(open_browser=True)
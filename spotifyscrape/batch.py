@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Copy many Spotify playlists to All Access in a single process"""
+
+import csv
+import logging
+import queue
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from argh import arg, named, CommandError
+
+from .allaccess import (
+    login, open_import_options, open_playlist_index, DRY_RUN_ARG,
+    BATCH_SIZE_ARG, BATCH_INTERVAL_ARG, JOBS_ARG, SEARCH_RATE_ARG,
+    ALLOW_REPEATS_ARG, RESUME_ARG
+)
+from .config import get_default
+from .spotify import (
+    get_client, parse_playlist_uri, USERNAME_ARG, CLIENT_SECRET_ARG,
+    REDIRECT_URI_ARG, IF_CHANGED_ARG
+)
+from .transfer import (
+    copy_playlist, SPOTIFY_CLIENT_ID_ARG, GMUSIC_CLIENT_ID_ARG, PAGE_JOBS_ARG,
+    QUEUE_SIZE_ARG, NO_CACHE_ARG
+)
+
+
+@arg(
+    'manifest', help='A file with one Spotify playlist URI or URL per line, ' +
+                     'optionally followed by a comma and the All Access ' +
+                     'playlist name.'
+)
+@arg(
+    '--playlist-jobs', type=int,
+    help='The number of playlists to copy at the same time.'
+)
+@USERNAME_ARG
+@SPOTIFY_CLIENT_ID_ARG
+@CLIENT_SECRET_ARG
+@REDIRECT_URI_ARG
+@GMUSIC_CLIENT_ID_ARG
+@PAGE_JOBS_ARG
+@QUEUE_SIZE_ARG
+@DRY_RUN_ARG
+@BATCH_SIZE_ARG
+@BATCH_INTERVAL_ARG
+@JOBS_ARG
+@SEARCH_RATE_ARG
+@NO_CACHE_ARG
+@IF_CHANGED_ARG
+@ALLOW_REPEATS_ARG
+@RESUME_ARG
+@named('batch')
+def batch(manifest, playlist_jobs=None, username=None, spotify_client_id=None,
+          client_secret=None, redirect_uri=None, gmusic_client_id=None,
+          page_jobs=None, queue_size=1000, dry_run=False, batch_size=None,
+          batch_interval=None, jobs=None, search_rate=None, no_cache=False,
+          if_changed=False, allow_repeats=False, resume=False):
+    """
+    Copies every Spotify playlist listed in a manifest file to Google Play
+    Music All Access.
+
+    This does the same as running "transfer" for each playlist, but it logs
+    in to each service only once, and the playlists share the rate limits,
+    the caches and the index of All Access playlists. Several playlists are
+    copied at the same time, except playlists with the same All Access name,
+    from the manifest or from Spotify, which are copied one after the other.
+    A playlist that fails does not stop the others.
+    """
+
+    playlist_jobs = get_default(playlist_jobs, "Batch", "playlist-jobs", int)
+    page_jobs = get_default(page_jobs, "Spotify", "jobs", int)
+    jobs = get_default(jobs, "All Access", "jobs", int)
+
+    try:
+        entries = read_manifest(manifest)
+    except OSError as error:
+        raise CommandError(f"Unable to read the manifest: {error}")
+
+    if not entries:
+        raise CommandError("The manifest does not list any playlists.")
+
+    # The clients are shared, so their connection pools must be big enough
+    # for every playlist running at the same time
+    spotify = get_client(
+        username, spotify_client_id, client_secret, redirect_uri,
+        page_jobs * playlist_jobs
+    )
+    api = login(gmusic_client_id, search_rate, jobs * playlist_jobs)
+
+    options = open_import_options(
+        no_cache, dry_run=dry_run, batch_size=batch_size,
+        batch_interval=batch_interval, jobs=jobs, allow_repeats=allow_repeats,
+        resume=resume
+    )
+
+    try:
+        playlist_index = open_playlist_index(api)
+        playlist_index.refresh()
+        options.playlist_index = playlist_index
+
+        messages = queue.Queue()
+
+        def copy(entry):
+            """Copy one playlist. Runs on a worker thread."""
+            uri, name = entry
+            label = name or uri
+            try:
+                for line in copy_playlist(
+                        lambda: spotify, lambda: api, uri, options, name,
+                        page_jobs=page_jobs, queue_size=queue_size,
+                        use_cache=not no_cache, if_changed=if_changed):
+                    messages.put(f"{label}: {line.strip()}")
+            except Exception as error:
+                logging.debug(f"Copying {uri} failed", exc_info=True)
+                messages.put(f"{label}: Failed. {error}")
+                return False
+
+            return True
+
+        with ThreadPoolExecutor(max_workers=playlist_jobs) as executor:
+            futures = [executor.submit(copy, entry) for entry in entries]
+            while not all(future.done() for future in futures) or \
+                    not messages.empty():
+                try:
+                    yield messages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+        failed = [
+            entry[1] or entry[0]
+            for entry, future in zip(entries, futures) if not future.result()
+        ]
+        yield f"Copied {len(entries) - len(failed)} of {len(entries)} playlists."
+        yield from options.get_cache_stats()
+
+        if failed:
+            yield "Failed playlists:"
+            for label in failed:
+                yield f"  {label}"
+    finally:
+        options.close()
+
+
+def read_manifest(path):
+    """
+    Read a batch manifest. Each line has a playlist URI and an optional
+    name, separated by a comma. Blank lines and lines that start with # are
+    skipped.
+
+    Returns a list of (uri, name) tuples. Name is None if not given.
+    """
+    entries = list()
+    with open(path, "r", newline="") as manifest_file:
+        for line_number, row in enumerate(csv.reader(manifest_file), 1):
+            if not row or not row[0].strip() or row[0].startswith("#"):
+                continue
+
+            uri = row[0].strip()
+            name = ",".join(row[1:]).strip() or None
+            try:
+                parse_playlist_uri(uri)
+            except CommandError:
+                sys.stderr.write(
+                    f"Skipping line {line_number}, not a playlist URI: {uri}\n"
+                )
+                continue
+
+            entries.append((uri, name))
+
+    return entries
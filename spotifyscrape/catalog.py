@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Local index of the All Access tracks seen in search results and listings"""
+
+import re
+import time
+import unicodedata
+
+from .sqlitestore import SQLiteStore
+
+# Commit to disk after this many tracks are added
+COMMIT_INTERVAL = 500
+# The lowest score of a track found in the index without searching
+MATCH_SCORE = 0.9
+# The lowest album similarity of a track found in the index, if the row has
+# an album. Without it a track from another album could still score 0.9.
+MIN_ALBUM_SIMILARITY = 1.0
+# The most candidates read for one lookup
+MAX_CANDIDATES = 1000
+
+TITLE_WEIGHT = 0.6
+ARTIST_WEIGHT = 0.3
+ALBUM_WEIGHT = 0.1
+
+# "(feat. X)", "[ft. X]" and a trailing "feat. X"
+FEATURING = re.compile(
+    r"[(\[]\s*(?:feat|ft|featuring)\b\.?[^)\]]*[)\]]?"
+    r"|\s(?:feat|ft|featuring)\b\.?\s.*$"
+)
+TOKEN = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    store_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    token TEXT NOT NULL,
+    store_id TEXT NOT NULL,
+    PRIMARY KEY (token, store_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS token_counts (
+    token TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text):
+    """
+    Split a title, artist or album into normalized words. Case, accents,
+    punctuation and featured artists are ignored, so "Song (feat. X)" and
+    "song" have the same words, but "Song - X Remix" does not.
+    """
+    text = unicodedata.normalize("NFKD", text or "").casefold()
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = FEATURING.sub(" ", text).replace("&", " and ")
+    return TOKEN.findall(text)
+
+
+def get_normalized_term(trackinfo):
+    """A search term for a CSV row with punctuation and featuring removed."""
+    return " ".join(tokenize(trackinfo[0]) + tokenize(trackinfo[1]))
+
+
+def score_track(trackinfo, track):
+    """
+    Score how well a catalog track matches a CSV row, from 0 to 1.
+
+    Titles must have the same words to score fully. Artists and albums only
+    need one to contain the other, so "Artist" matches "Artist & Friend" and
+    "Album" matches "Album (Deluxe)".
+    """
+    title = get_similarity(
+        tokenize(trackinfo[0]), tokenize(track.get('title')), exact=True
+    )
+    artist = get_similarity(tokenize(trackinfo[1]), tokenize(track.get('artist')))
+
+    if len(trackinfo) > 2 and trackinfo[2]:
+        album = get_similarity(tokenize(trackinfo[2]), tokenize(track.get('album')))
+        score = TITLE_WEIGHT * title + ARTIST_WEIGHT * artist + ALBUM_WEIGHT * album
+    else:
+        score = (TITLE_WEIGHT * title + ARTIST_WEIGHT * artist) / \
+            (TITLE_WEIGHT + ARTIST_WEIGHT)
+
+    return round(score, 6)
+
+
+def album_matches(trackinfo, album):
+    """
+    Whether a catalog track's album agrees with a CSV row. Rows without an
+    album match any album.
+
+    >>> album_matches(['Song', 'Artist', 'Studio Album'], 'Studio Album (Deluxe)')
+    True
+    >>> album_matches(['Song', 'Artist', 'Studio Album'], 'Live in Tokyo')
+    False
+    >>> album_matches(['Song', 'Artist'], 'Live in Tokyo')
+    True
+    """
+    if len(trackinfo) < 3 or not trackinfo[2]:
+        return True
+    similarity = get_similarity(tokenize(trackinfo[2]), tokenize(album))
+    return similarity >= MIN_ALBUM_SIMILARITY
+
+
+def get_similarity(words, other_words, exact=False):
+    """
+    The Jaccard similarity of two word lists if ``exact``, or else the
+    fraction of the shorter list found in the longer one.
+    """
+    words = set(words)
+    other_words = set(other_words)
+    if not words or not other_words:
+        return 0.0
+
+    common = len(words & other_words)
+    if exact:
+        return common / len(words | other_words)
+    return common / min(len(words), len(other_words))
+
+
+def rank_tracks(trackinfo, tracks):
+    """Sort catalog tracks from the best to the worst match of a CSV row."""
+    return sorted(tracks, key=lambda track: -score_track(trackinfo, track))
+
+
+class CatalogIndex(SQLiteStore):
+    """
+    An inverted index of the catalog tracks we have already seen, so rows
+    can be matched without searching.
+
+    Every track returned by a search, an album lookup or a playlist listing
+    is added, with its title words as index keys. A row is looked up by the
+    words of its title and the candidates are ranked with score_track.
+    """
+
+    def __init__(self, path):
+        super(CatalogIndex, self).__init__(path, SCHEMA, COMMIT_INTERVAL)
+        self.hits = 0
+
+    def add_tracks(self, tracks):
+        """Add catalog tracks, as returned by the All Access API."""
+        now = time.time()
+        with self.lock:
+            for track in tracks:
+                store_id = track.get('storeId') or track.get('nid')
+                if not store_id or not track.get('title'):
+                    continue
+
+                for token in set(tokenize(track['title'])):
+                    self._add_token(token, store_id)
+                self._write(
+                    "INSERT OR REPLACE INTO tracks "
+                    "(store_id, title, artist, album, updated) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (store_id, track['title'], track.get('artist', ""),
+                     track.get('album', ""), now)
+                )
+
+    def _add_token(self, token, store_id):
+        """Index a track under a word. Must hold the lock."""
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO tokens (token, store_id) VALUES (?, ?)",
+            (token, store_id)
+        )
+        if cursor.rowcount == 1:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO token_counts (token, count) VALUES (?, 0)",
+                (token,)
+            )
+            self.connection.execute(
+                "UPDATE token_counts SET count = count + 1 WHERE token = ?",
+                (token,)
+            )
+
+    def find(self, trackinfo):
+        """
+        Get the store ID of the best match of a CSV row, or None. If the row
+        has an album, the track's album must agree with it.
+        """
+        words = set(tokenize(trackinfo[0]))
+        if not words:
+            return None
+
+        with self.lock:
+            counts = self.connection.execute(
+                "SELECT token, count FROM token_counts "
+                f"WHERE token IN ({', '.join('?' * len(words))})",
+                list(words)
+            ).fetchall()
+            # A word that was never seen means there is no match
+            if len(counts) < len(words):
+                return None
+
+            # Read the candidates of the rarest word only
+            rarest = min(counts, key=lambda row: row[1])[0]
+            candidates = self.connection.execute(
+                "SELECT t.store_id, t.title, t.artist, t.album "
+                "FROM tokens k JOIN tracks t ON t.store_id = k.store_id "
+                "WHERE k.token = ? LIMIT ?",
+                (rarest, MAX_CANDIDATES)
+            ).fetchall()
+
+        best_score, best_id = 0, None
+        for store_id, title, artist, album in candidates:
+            if not words.issubset(tokenize(title)):
+                continue
+            if not album_matches(trackinfo, album):
+                continue
+
+            score = score_track(
+                trackinfo, {'title': title, 'artist': artist, 'album': album}
+            )
+            if score > best_score:
+                best_score, best_id = score, store_id
+
+        if best_score < MATCH_SCORE:
+            return None
+
+        with self.lock:
+            self.hits = self.hits + 1
+        return best_id
@@ -27,3 +27,28 @@ def read_config():
 
     return CONFIG
 
+
+
+def get_cache_path(name):
+    """
+    Get the path of a file in the application cache directory. The directory
+    is created if it does not exist.
+    """
+    cache_dir = os.path.expanduser(read_config().get("Cache", "path"))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    return os.path.join(cache_dir, name)
+
+
+def get_default(value, section, option, type=str):
+    """
+    Return ``value``, or the value of ``option`` from the configuration if
+    ``value`` is None.
+
+    Command-line defaults are resolved this way instead of when the commands
+    are defined, so the configuration is only read when a command runs.
+    """
+    if value is not None:
+        return value
+
+    return type(read_config().get(section, option))
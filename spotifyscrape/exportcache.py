@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Cache of exported Spotify playlists, keyed by playlist snapshot"""
+
+import json
+import logging
+import os
+
+from .profiling import csv_reader, csv_writer
+
+
+class ExportCache(object):
+    """
+    Keeps the last export of each Spotify playlist on disk, along with the
+    playlist's ``snapshot_id``. Spotify changes the snapshot whenever a
+    playlist changes, so a cached export with the same snapshot can be used
+    instead of downloading the tracks again.
+
+    Each playlist is stored as a CSV file of rows and a JSON file with the
+    snapshot and playlist name. The JSON file is written last, so an
+    interrupted export is never used.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, playlist_id):
+        base = os.path.join(self.directory, playlist_id)
+        return base + ".csv", base + ".json"
+
+    def is_current(self, playlist_id, snapshot_id):
+        """Check if the cached export of a playlist has this snapshot."""
+        if not snapshot_id:
+            return False
+
+        rows_path, meta_path = self._paths(playlist_id)
+        if not os.path.exists(rows_path) or not os.path.exists(meta_path):
+            return False
+
+        try:
+            with open(meta_path, "r") as meta_file:
+                meta = json.load(meta_file)
+        except ValueError as error:
+            logging.debug(f"Ignoring invalid export cache {meta_path}: {error}")
+            return False
+
+        return meta.get('snapshot_id') == snapshot_id
+
+    def load(self, playlist_id):
+        """Lazily read the cached rows of a playlist."""
+        rows_path, _ = self._paths(playlist_id)
+        with open(rows_path, "r", newline="") as rows_file:
+            yield from csv_reader(rows_file, "cache read")
+
+    def save(self, playlist_id, snapshot_id, name, rows):
+        """
+        Pass ``rows`` through, writing each one to the cache as it goes by.
+        The cache is only updated once every row has been read.
+        """
+        rows_path, meta_path = self._paths(playlist_id)
+
+        # Remove the old snapshot first, so a partial export is never used
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        with open(rows_path, "w", newline="") as rows_file:
+            writer = csv_writer(rows_file, "cache write")
+            for row in rows:
+                writer.writerow(row)
+                yield row
+
+        if snapshot_id:
+            with open(meta_path, "w") as meta_file:
+                json.dump({'snapshot_id': snapshot_id, 'name': name}, meta_file)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""The caches and settings shared by the imports of one command"""
+
+from .config import get_default
+
+
+class ImportOptions(object):
+    """
+    The caches and settings of an import. A command that imports several
+    playlists passes the same options to each import.
+
+    ``cache``, ``track_map`` and ``catalog`` are the search cache, the track
+    map and the catalog index, or None if they are not used.
+    ``playlist_index`` is the PlaylistIndex to find playlists in. It is
+    opened by the first import if not given. Settings that are None are read
+    from the configuration.
+    """
+
+    def __init__(self, cache=None, track_map=None, catalog=None,
+                 playlist_index=None, dry_run=False, batch_size=None,
+                 batch_interval=None, jobs=None, allow_repeats=False,
+                 resume=False):
+        self.cache = cache
+        self.track_map = track_map
+        self.catalog = catalog
+        self.playlist_index = playlist_index
+        self.dry_run = dry_run
+        self.batch_size = get_default(
+            batch_size, "All Access", "batch-size", int
+        )
+        self.batch_interval = get_default(
+            batch_interval, "All Access", "batch-interval", float
+        )
+        self.jobs = get_default(jobs, "All Access", "jobs", int)
+        self.allow_repeats = allow_repeats
+        self.resume = resume
+
+    def get_cache_stats(self):
+        """Yield the number of tracks found in each cache."""
+        if self.cache:
+            yield f"Search cache: {self.cache.hits} hits, {self.cache.misses} misses."
+        if self.track_map:
+            yield f"Track map: {self.track_map.hits} tracks found without searching."
+        if self.catalog:
+            yield f"Catalog index: {self.catalog.hits} tracks found without searching."
+
+    def close(self):
+        """
+        Commit and close the caches. Call it in a finally block, so the
+        results found so far are kept when the import fails.
+        """
+        if self.cache:
+            self.cache.close()
+        if self.track_map:
+            self.track_map.close()
+        if self.catalog:
+            self.catalog.close()
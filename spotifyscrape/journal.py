@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Append-only journal of import progress, used to resume imports"""
+
+import hashlib
+import json
+import logging
+import os
+
+# Search results that do not need to be retried when resuming
+FINAL_RESULTS = ("Dupe", "No Results")
+
+
+def row_digest(trackinfo):
+    """The SHA-1 of an input row's content, as a hex string."""
+    return hashlib.sha1("\x1f".join(trackinfo).encode("utf-8")).hexdigest()
+
+
+def row_key(trackinfo, occurrence, digest=None):
+    """
+    Build the journal key of an input row. ``occurrence`` counts earlier rows
+    with the same content, so repeated rows get their own keys. Pass the
+    ``digest`` of the row if it is already known.
+    """
+    digest = digest or row_digest(trackinfo)
+    return f"{digest}:{occurrence}"
+
+
+class ImportJournal(object):
+    """
+    Records how each input row was resolved and whether it was added to the
+    playlist. Each record is one JSON line appended to the file.
+
+    Each record is flushed to the operating system as it arrives, so it
+    survives the process being killed. The file is only synced to disk
+    every ``sync_interval`` records and after each committed batch, so
+    journaling does not slow down the import.
+
+    Only the records of an earlier run are kept in memory. Keys are never
+    repeated within a run, so new records only need to be written.
+    """
+
+    def __init__(self, path, resume=False, sync_interval=100):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.unsynced = 0
+        self.rows = dict()
+
+        if resume and os.path.exists(path):
+            self._load()
+            mode = "a"
+        else:
+            mode = "w"
+
+        self.file = open(path, mode)
+
+    def _load(self):
+        """Read the records of an earlier run."""
+        with open(self.path, "r") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if the run was killed
+                    logging.debug(f"Ignoring invalid journal line: {line!r}")
+                    continue
+
+                row = self.rows.setdefault(record['key'], dict())
+                row.update(record)
+
+    def get(self, key):
+        """Get the recorded state of a row, or None."""
+        return self.rows.get(key)
+
+    def is_done(self, key):
+        """Check if a row was completely handled in an earlier run."""
+        row = self.rows.get(key)
+        return bool(row) and (
+            row.get('committed') or row.get('result') in FINAL_RESULTS
+        )
+
+    def resolved(self, key, store_id, result):
+        """Record the search result of a row."""
+        self._append({'key': key, 'id': store_id, 'result': result})
+
+    def committed(self, keys):
+        """Record that rows were added to the playlist."""
+        for key in keys:
+            self._append({'key': key, 'committed': True})
+        self.sync()
+
+    def sync(self):
+        """Write the pending records to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self, remove=False):
+        """Close the journal. ``remove`` deletes it once it is not needed."""
+        self.sync()
+        self.file.close()
+        if remove:
+            os.remove(self.path)
+
+    def _append(self, record):
+        """Append a record to the journal."""
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        self.unsynced = self.unsynced + 1
+        if self.unsynced >= self.sync_interval:
+            self.sync()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Buffer playlist mutations and send them to All Access in batches"""
+
+import logging
+import sys
+import time
+
+from .ratelimit import is_ambiguous
+
+
+class MutationBuffer(object):
+    """
+    Collects store IDs that should be added to a playlist and adds them in
+    batches instead of making one call per track.
+
+    A batch is sent when ``batch_size`` IDs are pending or when the oldest
+    pending ID has waited ``flush_interval`` seconds. If a batch fails, it is
+    split in half and each half is retried, until the failing tracks are
+    isolated. Tracks are always added in the order they were given.
+
+    A batch that timed out or failed with a server error may have been added
+    anyway, so it is not sent again. Its tracks are reported as failed, and
+    an import with --resume finds the ones that were added in the playlist.
+
+    ``on_added`` is called with the rows of the tracks in each batch that was
+    added successfully.
+    """
+
+    def __init__(self, api, playlist_id, batch_size=100, flush_interval=10.0,
+                 dry_run=False, on_added=None):
+        self.api = api
+        self.on_added = on_added
+        self.playlist_id = playlist_id
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.dry_run = dry_run
+
+        self.pending = list()
+        self.pending_since = None
+
+        self.added = 0
+        self.batches = 0
+        self.failed = list()
+
+    def add(self, store_id, row=None):
+        """
+        Queue a track to be added. ``row`` is kept to report failures.
+        """
+        if not self.pending:
+            self.pending_since = time.monotonic()
+
+        self.pending.append((store_id, row))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush the pending tracks if the oldest has waited long enough."""
+        if self.pending and self.flush_interval is not None and \
+                time.monotonic() - self.pending_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Add all pending tracks to the playlist."""
+        if not self.pending:
+            return
+
+        batch = self.pending
+        self.pending = list()
+        self.pending_since = None
+
+        start = time.monotonic()
+        added = self._add_batch(batch)
+        elapsed = time.monotonic() - start
+
+        self.batches = self.batches + 1
+        self.added = self.added + added
+
+        if not self.dry_run:
+            sys.stderr.write(
+                f"Added {added} of {len(batch)} songs in {elapsed:.2f}s "
+                f"(batch {self.batches})\n"
+            )
+
+    def _add_batch(self, batch):
+        """
+        Send one batch. On failure, split the batch and retry each half.
+
+        Returns the number of tracks that were added.
+        """
+        if self.dry_run:
+            return len(batch)
+
+        try:
+            self.api.add_songs_to_playlist(
+                self.playlist_id, [store_id for store_id, _ in batch]
+            )
+        except Exception as error:
+            if len(batch) == 1 or is_ambiguous(error):
+                logging.exception(error)
+                self.failed.extend(row for _, row in batch)
+                return 0
+
+            logging.debug(
+                f"Adding a batch of {len(batch)} songs failed. Splitting."
+            )
+            middle = len(batch) // 2
+            return self._add_batch(batch[:middle]) + \
+                self._add_batch(batch[middle:])
+
+        if self.on_added:
+            self.on_added([row for _, row in batch])
+        return len(batch)
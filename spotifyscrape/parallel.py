@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Run blocking API calls on a bounded pool of worker threads"""
+
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Marks the end of a prefetched iterable
+_DONE = object()
+
+
+def imap_ordered(func, iterable, jobs=1, window=None):
+    """
+    Call ``func`` on each item of ``iterable`` using up to ``jobs`` threads.
+
+    Yields ``(item, result)`` tuples in the same order as the input. At most
+    ``window`` items (twice the number of jobs by default) are in flight at
+    any time, so the input is read lazily. With one job, everything runs in
+    the calling thread.
+    """
+    if jobs <= 1:
+        for item in iterable:
+            yield item, func(item)
+        return
+
+    window = window or jobs * 2
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for item in iterable:
+            pending.append((item, executor.submit(func, item)))
+
+            if len(pending) >= window:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def chunked(iterable, size):
+    """Group the items of ``iterable`` into lists of up to ``size`` items."""
+    chunk = list()
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = list()
+
+    if chunk:
+        yield chunk
+
+
+def prefetch(iterable, size):
+    """
+    Iterate over ``iterable`` on a background thread and yield its items.
+
+    Up to ``size`` items are kept ready in a queue. When the queue is full the
+    background thread waits, so a slow consumer holds back the producer. An
+    exception raised by ``iterable`` is raised again in the consumer.
+    """
+    items = queue.Queue(max(1, size))
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except Exception as error:
+            put((_DONE, error))
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item, error = items.get()
+            if error:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stopped.set()
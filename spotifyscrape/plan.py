@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Import plans: the resolved rows of an import, to be applied later"""
+
+import json
+
+PLAN_VERSION = 1
+
+
+class PlanWriter(object):
+    """
+    Writes an import plan. The first line is a JSON object with the playlist
+    name and description, written when the plan is opened, so a plan without
+    rows can still be applied. Every other line is one input row, with its
+    journal key, the store ID it was resolved to and the search result.
+    """
+
+    def __init__(self, path, header):
+        self.path = path
+        self.file = open(path, "w")
+        self.rows = 0
+        self._write({
+            'version': PLAN_VERSION,
+            'name': header['name'],
+            'description': header['description'],
+        })
+
+    def add(self, key, trackinfo, store_id, result):
+        """Write the resolution of one row."""
+        self._write({
+            'key': key, 'row': trackinfo, 'id': store_id, 'result': result
+        })
+        self.rows = self.rows + 1
+
+    def close(self):
+        self.file.close()
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def read_plan(path):
+    """
+    Read an import plan.
+
+    Returns a tuple of the header dict, a generator of the rows and a dict
+    of journal key to (store ID, result). The dict is filled in as the rows
+    are read, so each row can be looked up as soon as it arrives.
+    """
+    plan_file = open(path, "r")
+    try:
+        header = json.loads(plan_file.readline())
+    except ValueError:
+        plan_file.close()
+        raise ValueError(f"{path} is not an import plan.")
+
+    if header.get('version') != PLAN_VERSION:
+        plan_file.close()
+        raise ValueError(f"{path} is not an import plan.")
+
+    resolved = dict()
+
+    def read_rows():
+        with plan_file:
+            for line in plan_file:
+                record = json.loads(line)
+                resolved[record['key']] = (record['id'], record['result'])
+                yield record['row']
+
+    return header, read_rows(), resolved
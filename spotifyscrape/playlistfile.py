@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Read the playlist files given to the import command"""
+
+import itertools
+
+from . import profiling
+from .track import Track
+
+
+def read_playlist(stream, header):
+    """
+    Yield the rows of a playlist file as [Track, Artist, Album] lists, with
+    the Spotify ID and ISRC added if the file has them.
+
+    The ``# Playlist:`` and ``# Description:`` comments at the start of the
+    file are read into the ``header`` dict before the first row is yielded.
+    The rest of the file is either CSV, as written by the export commands,
+    or JSON lines. It is parsed by a single reader, so quoted fields may
+    contain newlines.
+
+    ``stream`` should be opened with ``newline=""``.
+    """
+    first_line = read_header(stream, header)
+    if not first_line:
+        return
+
+    lines = itertools.chain([first_line], stream)
+    if first_line.lstrip().startswith("{"):
+        rows = read_json_rows(lines)
+    else:
+        rows = profiling.csv_reader(lines)
+
+    for row in rows:
+        if row:
+            yield row
+
+
+def read_header(stream, header):
+    """
+    Read the comments at the start of a playlist file into ``header``.
+    Returns the first line that is not a comment, or "" at the end of the
+    file.
+    """
+    for line in stream:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if not stripped.startswith("#"):
+            return line
+
+        parts = [x.strip() for x in stripped[1:].split(":", 1)]
+        if len(parts) == 2:
+            if parts[0] == "Playlist":
+                header['name'] = parts[1]
+            elif parts[0] == "Description":
+                header['description'] = parts[1]
+
+    return ""
+
+
+def read_json_rows(lines):
+    """
+    Yield a row for each JSON line. Each line is an object with the keys of
+    a Track: title, artist, album and optionally spotify_id and isrc.
+    Missing values are empty.
+    """
+    keys = Track._fields[:5]
+    records = profiling.json_reader(line for line in lines if line.strip())
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError(f"Expected a JSON object, got {record!r}")
+
+        row = [
+            "" if record.get(key) is None else str(record[key]) for key in keys
+        ]
+        # Leave out the IDs if there are none, like the CSV files do
+        if not row[3] and not row[4]:
+            del row[3:]
+        yield row
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Local index of the user's All Access playlists"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+
+class PlaylistIndex(object):
+    """
+    Keeps the ID, name, share token and access of every user playlist in a
+    local JSON file. No tracks are stored.
+
+    The newest ``lastModifiedTimestamp`` seen is kept as a change token, so
+    a refresh only downloads the playlists that changed since the last run.
+
+    The index can be shared by multiple threads. Hold ``name_lock(name)``
+    while looking up a playlist and creating it if it is missing, so two
+    threads never create the same playlist.
+    """
+
+    def __init__(self, api, path):
+        self.api = api
+        self.path = path
+        self.playlists = dict()
+        self.updated = None
+        self.lock = threading.Lock()
+        self.name_locks = dict()
+        self.refreshed = False
+
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as index_file:
+                    data = json.load(index_file)
+                self.playlists = data['playlists']
+                self.updated = data['updated']
+            except (ValueError, KeyError) as error:
+                logging.debug(f"Ignoring invalid playlist index {path}: {error}")
+
+    def refresh(self):
+        """Download the playlists that changed since the last refresh."""
+        with self.lock:
+            if self.updated:
+                updated_after = datetime.fromtimestamp(
+                    int(self.updated) / 1000000, timezone.utc
+                )
+                changes = self.api.get_all_playlists(
+                    include_deleted=True, updated_after=updated_after
+                )
+            else:
+                changes = self.api.get_all_playlists()
+
+            for playlist in changes:
+                self._update(playlist)
+
+            logging.debug(f"{len(changes)} playlists changed since {self.updated}")
+            self.refreshed = True
+            self._save()
+
+    def find(self, name):
+        """Get the user playlists with the given name."""
+        if not self.refreshed:
+            self.refresh()
+
+        with self.lock:
+            return [
+                x for x in self.playlists.values()
+                if x['name'] == name and x['type'] == 'USER_GENERATED'
+            ]
+
+    def name_lock(self, name):
+        """Get the lock of a playlist name. It can be taken more than once."""
+        with self.lock:
+            return self.name_locks.setdefault(name, threading.RLock())
+
+    def add(self, playlist_id, name, share_token=None):
+        """Add a playlist that was created during this run."""
+        with self.lock:
+            self.playlists[playlist_id] = {
+                'id': playlist_id,
+                'name': name,
+                'shareToken': share_token,
+                'accessControlled': True,
+                'type': 'USER_GENERATED',
+            }
+            self._save()
+
+    def _update(self, playlist):
+        """Apply a playlist change returned by the API."""
+        timestamp = playlist.get('lastModifiedTimestamp')
+        if timestamp and (not self.updated or int(timestamp) > int(self.updated)):
+            self.updated = timestamp
+
+        if playlist.get('deleted'):
+            self.playlists.pop(playlist['id'], None)
+        else:
+            self.playlists[playlist['id']] = {
+                'id': playlist['id'],
+                'name': playlist['name'],
+                'shareToken': playlist.get('shareToken'),
+                'accessControlled': playlist.get('accessControlled'),
+                'type': playlist.get('type', 'USER_GENERATED'),
+            }
+
+    def _save(self):
+        """Write the index to disk."""
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as index_file:
+            json.dump(
+                {'updated': self.updated, 'playlists': self.playlists},
+                index_file
+            )
+        os.replace(temp_path, self.path)
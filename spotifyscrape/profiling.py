@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Record the count, size and latency of API calls and CSV reads and writes"""
+
+import contextlib
+import csv
+import json
+import sys
+import threading
+import time
+
+# The active profiler. Nothing is recorded unless --profile is given.
+PROFILER = None
+
+PERCENTILES = (50, 95, 99)
+
+
+class CallStats(object):
+    """The calls made to one API method, or one kind of CSV operation."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latencies = list()
+
+    def report(self):
+        """Summarize the calls as a dict."""
+        latencies = sorted(self.latencies)
+        total = sum(latencies)
+        report = {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "total_s": round(total, 6),
+            "mean_ms": round(total / len(latencies) * 1000, 3) if latencies else 0,
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0,
+        }
+        for percentile in PERCENTILES:
+            report[f"p{percentile}_ms"] = round(
+                get_percentile(latencies, percentile) * 1000, 3
+            )
+        return report
+
+
+class Profiler(object):
+    """Collects CallStats by name. Safe to use from any number of threads."""
+
+    def __init__(self):
+        self.stats = dict()
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+
+    def record(self, name, elapsed=None, nbytes=0, retries=0, error=False):
+        """Record one call."""
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallStats()
+
+            stats.count = stats.count + 1
+            stats.bytes = stats.bytes + nbytes
+            stats.retries = stats.retries + retries
+            if error:
+                stats.errors = stats.errors + 1
+            if elapsed is not None:
+                stats.latencies.append(elapsed)
+
+    def report(self):
+        """Summarize everything recorded so far as a dict."""
+        with self.lock:
+            return {
+                "elapsed_s": round(time.monotonic() - self.start, 3),
+                "calls": {
+                    name: self.stats[name].report()
+                    for name in sorted(self.stats)
+                },
+            }
+
+
+def enable():
+    """Start recording calls."""
+    global PROFILER
+    PROFILER = Profiler()
+    return PROFILER
+
+
+def record(name, elapsed=None, nbytes=0, retries=0, error=False):
+    """Record one call, if profiling is enabled."""
+    if PROFILER is not None:
+        PROFILER.record(name, elapsed, nbytes, retries, error)
+
+
+@contextlib.contextmanager
+def timed(name, nbytes=0):
+    """Record the time taken by the body of a with statement."""
+    if PROFILER is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        PROFILER.record(name, time.perf_counter() - start, nbytes, error=True)
+        raise
+    PROFILER.record(name, time.perf_counter() - start, nbytes)
+
+
+def write_report(path):
+    """Write the profile report as JSON to ``path``, or to stderr for "-"."""
+    if PROFILER is None:
+        return
+
+    report = json.dumps(PROFILER.report(), indent=2)
+    if path == "-":
+        sys.stderr.write(report + "\n")
+    else:
+        with open(path, "w") as report_file:
+            report_file.write(report + "\n")
+
+
+def csv_writer(file, name="csv write", **kwargs):
+    """A ``csv.writer`` that records each row written, if profiling."""
+    if PROFILER is None:
+        return csv.writer(file, **kwargs)
+
+    return ProfiledWriter(file, name, **kwargs)
+
+
+def csv_reader(lines, name="csv parse", **kwargs):
+    """A ``csv.reader`` that records each row parsed, if profiling."""
+    if PROFILER is None:
+        return csv.reader(lines, **kwargs)
+
+    return profile_rows(lines, name, **kwargs)
+
+
+def json_reader(lines, name="json parse"):
+    """Parse a JSON value from each line, recording each one, if profiling."""
+    if PROFILER is None:
+        return map(json.loads, lines)
+
+    return profile_json(lines, name)
+
+
+class ProfiledWriter(object):
+    """Wraps a csv.writer to record the time and bytes of every row."""
+
+    def __init__(self, file, name, **kwargs):
+        self.file = file
+        self.name = name
+        self.nbytes = 0
+        self.writer = csv.writer(self, **kwargs)
+
+    def write(self, text):
+        """Called by the csv writer with each formatted row."""
+        self.nbytes = self.nbytes + len(text.encode("utf-8"))
+        return self.file.write(text)
+
+    def writerow(self, row):
+        self.nbytes = 0
+        start = time.perf_counter()
+        result = self.writer.writerow(row)
+        record(self.name, time.perf_counter() - start, self.nbytes)
+        return result
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+
+def profile_rows(lines, name, **kwargs):
+    """Parse CSV rows from ``lines``, recording the time and bytes of each."""
+    nbytes = [0]
+
+    def count(lines):
+        for line in lines:
+            nbytes[0] = nbytes[0] + len(line.encode("utf-8"))
+            yield line
+
+    reader = csv.reader(count(lines), **kwargs)
+    while True:
+        nbytes[0] = 0
+        start = time.perf_counter()
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        record(name, time.perf_counter() - start, nbytes[0])
+        yield row
+
+
+def profile_json(lines, name):
+    """Parse JSON lines, recording the time and bytes of each."""
+    for line in lines:
+        with timed(name, len(line.encode("utf-8"))):
+            value = json.loads(line)
+        yield value
+
+
+def record_response(service, response, *args, **kwargs):
+    """A requests response hook that records the bytes of each response."""
+    if PROFILER is not None:
+        PROFILER.record(
+            f"http {service}", response.elapsed.total_seconds(),
+            len(response.content or b"")
+        )
+    return response
+
+
+def get_percentile(values, percentile):
+    """The nearest-rank percentile of a sorted list."""
+    if not values:
+        return 0
+
+    rank = int(round(percentile / 100 * len(values))) - 1
+    return values[max(0, min(len(values) - 1, rank))]
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Limit the rate of calls made to a remote API"""
+
+import email.utils
+import functools
+import logging
+import random
+import re
+import threading
+import time
+
+from . import profiling
+
+# Exception class names of transient network errors that should be retried
+TRANSIENT_ERRORS = ("ConnectionError", "Timeout", "ConnectTimeout", "ReadTimeout")
+# Exception class names of errors raised before a request was sent
+CONNECT_ERRORS = ("ConnectTimeout", "NewConnectionError", "ConnectTimeoutError")
+# Matches HTTP errors that are only reported in an exception's message
+THROTTLE_MESSAGE = re.compile(r"\b(429|50[234])\b|Too Many Requests")
+TOO_MANY_REQUESTS_MESSAGE = re.compile(r"\b429\b|Too Many Requests")
+# Methods that change something. The server may have applied a call that
+# timed out or failed with a 5xx error, so these are not retried then.
+MUTATING_METHODS = frozenset([
+    "add_songs_to_playlist", "create_playlist", "edit_playlist",
+    "delete_playlist", "remove_entries_from_playlist",
+    "reorder_playlist_entry", "rate_songs",
+])
+
+
+class RateLimiter(object):
+    """
+    A token bucket that limits calls to ``rate`` per second.
+
+    One limiter can be shared by any number of threads. A ``rate`` of 0 or
+    None disables the limit.
+
+    The rate adapts to the service: every throttled call halves it (down to
+    ``min_rate``) and pauses all callers, and every successful call raises it
+    a little, up to ``max_rate``. Set ``max_rate`` above the starting rate to
+    find out whether the service allows more. Without it, or if it is lower,
+    the starting rate is the most that is ever used.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, max_rate=None,
+                 increase=0.05):
+        self.rate = rate
+        self.min_rate = min(min_rate, rate) if rate else min_rate
+        self.max_rate = max(max_rate or 0, rate or 0)
+        self.increase = increase
+        self.capacity = burst or max(1, rate or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call can be made."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif not self.rate:
+                    return
+                else:
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + (now - self.updated) * self.rate
+                    )
+                    self.updated = now
+
+                    if self.tokens >= 1:
+                        self.tokens = self.tokens - 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def throttled(self, delay):
+        """Slow down after a throttled call and pause for ``delay`` seconds."""
+        with self.lock:
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + delay
+            )
+            if self.rate:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = min(self.tokens, 0)
+                logging.debug(f"Throttled. Rate is now {self.rate:.2f}/s")
+
+    def succeeded(self):
+        """Speed up slowly after a successful call."""
+        if self.rate and self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class ThrottledClient(object):
+    """
+    Wraps an API client (``spotipy.Spotify`` or ``Mobileclient``) so every
+    method call waits for the rate limiter, and calls that are throttled or
+    fail with a transient error are retried.
+
+    A retry waits for the Retry-After time given by the server, or for a
+    jittered exponential backoff if none was given.
+
+    The methods in ``mutating_methods`` are only retried when the request
+    was certainly not applied: when it was throttled (429) or the
+    connection could not be made.
+    """
+
+    def __init__(self, client, limiter, max_retries=5, base_delay=1.0,
+                 max_delay=60.0, mutating_methods=MUTATING_METHODS):
+        self._client = client
+        self._limiter = limiter
+        self._max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._mutating_methods = mutating_methods
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            return self._call(attribute, *args, **kwargs)
+
+        return call
+
+    def _call(self, method, *args, **kwargs):
+        """Call an API method, retrying it when it is throttled."""
+        name = f"{type(self._client).__name__}.{method.__name__}"
+        idempotent = method.__name__ not in self._mutating_methods
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            self._limiter.acquire()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as error:
+                retry_after = get_retry_after(error, idempotent)
+                if retry_after is None or attempt >= self._max_retries:
+                    profiling.record(
+                        name, time.perf_counter() - start,
+                        retries=attempt, error=True
+                    )
+                    raise
+
+                backoff = random.uniform(
+                    0, min(self._max_delay, self._base_delay * 2 ** attempt)
+                )
+                delay = max(retry_after, backoff)
+                logging.debug(
+                    f"{method.__name__} failed ({error}). Retrying in {delay:.1f}s"
+                )
+                self._limiter.throttled(delay)
+                attempt = attempt + 1
+                continue
+
+            self._limiter.succeeded()
+            profiling.record(
+                name, time.perf_counter() - start, retries=attempt
+            )
+            return result
+
+
+def get_retry_after(error, idempotent=True):
+    """
+    Check if an error means the call should be retried. Calls that are not
+    ``idempotent`` are only retried if the error shows they were not
+    applied.
+
+    Returns the number of seconds the server asked us to wait (0 if it did
+    not say), or None if the call should not be retried.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+
+        response = getattr(error, "response", None)
+        status = getattr(error, "http_status", None) or \
+            getattr(response, "status_code", None)
+        headers = getattr(error, "headers", None) or \
+            getattr(response, "headers", None) or {}
+
+        if status == 429 or (idempotent and status and 500 <= status < 600):
+            return parse_retry_after(headers.get("Retry-After"))
+
+        if type(error).__name__ in CONNECT_ERRORS or \
+                (idempotent and type(error).__name__ in TRANSIENT_ERRORS):
+            return 0
+
+        message = THROTTLE_MESSAGE if idempotent else TOO_MANY_REQUESTS_MESSAGE
+        if not status and message.search(str(error)):
+            return 0
+
+        error = error.__cause__ or error.__context__
+
+    return None
+
+
+def is_ambiguous(error):
+    """
+    Check if a changing call that failed with ``error`` may still have been
+    applied by the server, like after a timeout or a 5xx error.
+    """
+    return get_retry_after(error) is not None and \
+        get_retry_after(error, idempotent=False) is None
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header, given in seconds or as an HTTP date."""
+    if not value:
+        return 0
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Persistent cache of All Access catalog searches"""
+
+import time
+import unicodedata
+
+from .sqlitestore import SQLiteStore
+
+# Commit to disk after this many writes
+COMMIT_INTERVAL = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search (
+    term TEXT PRIMARY KEY,
+    store_id TEXT,
+    reason TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+)
+"""
+
+
+def normalize_term(search_term):
+    """Normalize a search term so trivially different terms share an entry."""
+    search_term = unicodedata.normalize("NFKC", search_term)
+    return " ".join(search_term.casefold().split())
+
+
+class SearchCache(SQLiteStore):
+    """
+    Caches the result of catalog searches in a SQLite database.
+
+    Both hits and misses ("No Results") are cached. Hits expire after ``ttl``
+    seconds and misses after ``miss_ttl`` seconds. When there are more than
+    ``max_entries`` entries, the least recently used ones are removed.
+
+    The cache can be shared by multiple threads.
+    """
+
+    def __init__(self, path, ttl, miss_ttl, max_entries):
+        super(SearchCache, self).__init__(path, SCHEMA, COMMIT_INTERVAL)
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, search_term):
+        """
+        Get the cached result of a search.
+
+        Returns a tuple of the store ID (or None) and the result, or None if
+        the search is not cached.
+        """
+        term = normalize_term(search_term)
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT store_id, reason, created FROM search WHERE term = ?",
+                (term,)
+            ).fetchone()
+
+            if row:
+                store_id, reason, created = row
+                ttl = self.ttl if store_id else self.miss_ttl
+                if now - created < ttl:
+                    self.hits = self.hits + 1
+                    self._write(
+                        "UPDATE search SET used = ? WHERE term = ?", (now, term)
+                    )
+                    return store_id, reason
+
+            self.misses = self.misses + 1
+            return None
+
+    def put(self, search_term, store_id, reason):
+        """
+        Cache the result of a search. Failed searches are not cached.
+        """
+        if not store_id and reason != "No Results":
+            return
+
+        now = time.time()
+        with self.lock:
+            self._write(
+                "INSERT OR REPLACE INTO search "
+                "(term, store_id, reason, created, used) VALUES (?, ?, ?, ?, ?)",
+                (normalize_term(search_term), store_id or None, reason, now, now)
+            )
+
+    def purge(self):
+        """Remove all entries from the cache."""
+        with self.lock:
+            self.connection.execute("DELETE FROM search")
+            self.connection.commit()
+
+    def close(self):
+        """Remove expired and least recently used entries and save the cache."""
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM search WHERE "
+                "(store_id IS NOT NULL AND created < ?) OR "
+                "(store_id IS NULL AND created < ?)",
+                (now - self.ttl, now - self.miss_ttl)
+            )
+            self.connection.execute(
+                "DELETE FROM search WHERE term IN ("
+                "SELECT term FROM search ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        super(SearchCache, self).close()
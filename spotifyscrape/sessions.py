@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Shared HTTP sessions with connection pools sized for parallel requests"""
+
+import functools
+import threading
+
+from .profiling import record_response
+
+# The smallest connection pool we create, even for sequential commands
+MIN_POOL_SIZE = 10
+
+SESSIONS = dict()
+SESSIONS_LOCK = threading.Lock()
+
+
+def configure_session(session, pool_size=MIN_POOL_SIZE):
+    """
+    Mount keep-alive connection pools of ``pool_size`` connections per host on
+    a requests session, so parallel requests reuse connections instead of
+    opening new ones.
+    """
+    from requests.adapters import HTTPAdapter
+
+    pool_size = max(MIN_POOL_SIZE, pool_size or 0)
+    for prefix in ("https://", "http://"):
+        session.mount(prefix, HTTPAdapter(
+            pool_connections=MIN_POOL_SIZE, pool_maxsize=pool_size
+        ))
+    session.headers['Connection'] = 'keep-alive'
+
+    return session
+
+
+def get_session(name, pool_size=MIN_POOL_SIZE):
+    """
+    Get the session for a service. Every client of the same service in this
+    process shares one session and its connection pool.
+    """
+    import requests
+
+    with SESSIONS_LOCK:
+        if name not in SESSIONS:
+            session = configure_session(requests.Session(), pool_size)
+            session.hooks['response'].append(
+                functools.partial(record_response, name)
+            )
+            SESSIONS[name] = session
+        return SESSIONS[name]
@@ -4,38 +4,75 @@
 """Export a Spotify playlist to CSV"""
 
 import csv
+import itertools
+import logging
 import re
-import spotipy
 import sys
 import io
 
 from argh import arg, named, CommandError, aliases
 
-from .config import read_config
-from .spotipyutil import prompt_for_user_token
+from .config import get_default, get_cache_path
+from .exportcache import ExportCache
+from .parallel import chunked, imap_ordered
+from .profiling import csv_writer
+from .ratelimit import RateLimiter, ThrottledClient
+from .sessions import get_session
+from .spotipyutil import prompt_for_user_token, get_token_manager
+from .track import Track
 
 SPOTIFY_API_SCOPE = 'user-library-read'
+# The number of tracks requested in each page of a playlist
+PLAYLIST_PAGE_SIZE = 100
+# The maximum number of IDs accepted by the tracks endpoint
+TRACKS_PER_REQUEST = 50
+# The number of saved tracks requested in each page of the library
+LIBRARY_PAGE_SIZE = 50
+# A UTC date or time accepted by --since
+SINCE_PATTERN = re.compile(
+    r"(\d{4}-\d{2}-\d{2})(?:T(\d{2}:\d{2})(:\d{2})?Z?)?$"
+)
+TRACK_ID_PATTERNS = [
+    re.compile(r"spotify:track:([A-Za-z0-9]+)$"),
+    re.compile(r"https?://open\.spotify\.com/track/([A-Za-z0-9]+)"),
+    re.compile(r"([A-Za-z0-9]{22})$"),
+]
 USERNAME_ARG = arg(
     '--username',
-    help='Your Spotify user name',
-    default=read_config().get("Spotify", "username")
+    help='Your Spotify user name'
 )
 CLIENT_ID_ARG = arg(
-    '--client-id',
-    default=read_config().get("Spotify", "client-id")
+    '--client-id'
 )
 CLIENT_SECRET_ARG = arg(
-    '--client-secret',
-    default=read_config().get("Spotify", "client-secret")
+    '--client-secret'
 )
 REDIRECT_URI_ARG = arg(
-    '--redirect-uri',
-    default=read_config().get("Spotify", "redirect-uri")
+    '--redirect-uri'
+)
+IDS_ARG = arg(
+    '--ids',
+    help='Add the Spotify ID and ISRC of each track to the output.'
+)
+NO_CACHE_ARG = arg(
+    '--no-cache',
+    help='Always download the playlist, even if it has not changed.'
+)
+IF_CHANGED_ARG = arg(
+    '--if-changed',
+    help='Do nothing if the playlist has not changed since it was last exported.'
+)
+JOBS_ARG = arg(
+    '--jobs', type=int,
+    help='The number of requests to make at the same time.'
 )
 
 @arg('tracklist', help="A text file containing the Spotify track URIs.")
+@arg('--keep-duplicates', help="Export a track every time it appears in the list.")
+@IDS_ARG
+@JOBS_ARG
 @named('export-tracks')
-def exporttracks(tracklist):
+def exporttracks(tracklist, keep_duplicates=False, ids=False, jobs=None):
     """
     Given a list of Spotify track URIs, prints the track Title, Artist and
     Album.
@@ -43,34 +80,87 @@ def exporttracks(tracklist):
     Expected input is in this format:
 
         spotify:track:1oVlMEQe8myOjNCASaAHnQ
-        spotify:track:0zoHzM4bKGQ8Q6wze334Qs
-        spotify:track:4p2olbKKjXCdJmR4Xa1mYv
+        https://open.spotify.com/track/0zoHzM4bKGQ8Q6wze334Qs
+        4p2olbKKjXCdJmR4Xa1mYv
 
     The input file should have one item per line. Blank lines are OK. Invalid
-    items will be skipped.
+    items will be skipped. Tracks are exported in the order they appear.
     """
 
-    spotify = spotipy.Spotify()
-    writer = csv.writer(sys.stdout, quoting=csv.QUOTE_ALL)
-    csv_write_header(writer)
+    import spotipy
+
+    jobs = get_default(jobs, "Spotify", "jobs", int)
+    spotify = throttle(spotipy.Spotify(
+        requests_session=get_session("spotify", jobs)
+    ))
+    writer = csv_writer(sys.stdout, quoting=csv.QUOTE_ALL)
+    csv_write_header(writer, ids)
+    stats = {'processed': 0, 'invalid': 0, 'duplicates': 0}
+    found = 0
     failed = 0
-    tracks = None
+
+    def get_tracks(track_ids):
+        return [
+            Track.from_spotify(track) if track else None
+            for track in spotify.tracks(track_ids)['tracks']
+        ]
 
     with open(tracklist, 'r') as tracklistfile:
-        lines = [line.strip() for line in tracklistfile.readlines()]
-        lines = [line for line in lines if line and len(line) > 0]
+        track_ids = read_track_ids(tracklistfile, stats, not keep_duplicates)
+        chunks = chunked(track_ids, TRACKS_PER_REQUEST)
+
+        for _, tracks in imap_ordered(get_tracks, chunks, jobs=jobs):
+            for track in tracks:
+                if track:
+                    writer.writerow(track.to_row(ids))
+                    found = found + 1
+                else:
+                    failed = failed + 1
+
+    failed = failed + stats['invalid']
+    sys.stderr.write(
+        f"{stats['processed']} tracks processed. {found} found. {failed} failed.\n"
+    )
+    if stats['duplicates']:
+        sys.stderr.write(f"{stats['duplicates']} duplicates skipped.\n")
 
-        tracks = spotify.tracks(lines)['tracks']
 
-    for track in tracks:
-        if track:
-            csv_write_track(writer, track)
-        else:
-            failed = failed + 1
+def parse_track_id(line):
+    """
+    Get the track ID from a Spotify track URI, URL or bare ID. Returns None if
+    the line is not recognized.
+    """
+    for pattern in TRACK_ID_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            return match.group(1)
 
-    sys.stderr.write(
-        f"{len(lines)} tracks processed. {len(tracks) - failed} found. {failed} failed.\n"
-    )
+    return None
+
+
+def read_track_ids(tracklistfile, stats, dedupe=True):
+    """
+    Lazily read track IDs from a file, one per line. Blank lines are skipped.
+    Invalid lines are reported and counted in ``stats``.
+    """
+    seen = set()
+    for line in tracklistfile:
+        line = line.strip()
+        if not line:
+            continue
+
+        stats['processed'] = stats['processed'] + 1
+        track_id = parse_track_id(line)
+
+        if not track_id:
+            sys.stderr.write(f"Skipping invalid track URI: {line}\n")
+            stats['invalid'] = stats['invalid'] + 1
+        elif dedupe and track_id in seen:
+            stats['duplicates'] = stats['duplicates'] + 1
+        else:
+            if dedupe:
+                seen.add(track_id)
+            yield track_id
 
 
 def check_required_arg(argument, name):
@@ -91,6 +181,11 @@ def checktoken(username=None, client_id=None, client_secret=None,
                redirect_uri=None):
     """Login to Spotify or refresh the authorization token."""
 
+    username = get_default(username, "Spotify", "username")
+    client_id = get_default(client_id, "Spotify", "client-id")
+    client_secret = get_default(client_secret, "Spotify", "client-secret")
+    redirect_uri = get_default(redirect_uri, "Spotify", "redirect-uri")
+
     check_required_arg(username, "Username")
     check_required_arg(client_id, "Client ID")
     check_required_arg(client_secret, "Client Secret")
@@ -111,11 +206,16 @@ def checktoken(username=None, client_id=None, client_secret=None,
 @CLIENT_ID_ARG
 @CLIENT_SECRET_ARG
 @REDIRECT_URI_ARG
+@IDS_ARG
+@NO_CACHE_ARG
+@IF_CHANGED_ARG
+@JOBS_ARG
 @arg('uri', help='The Public HTTP URL to a playlist')
 @aliases('export-playlist')
 @named('export')
 def exportplaylist(uri, username=None, client_id=None, client_secret=None,
-                   redirect_uri=None):
+                   redirect_uri=None, ids=False, no_cache=False,
+                   if_changed=False, jobs=None):
     """
     Given a Spotify playlist's URI, prints the track Title, Artist and Album.
 
@@ -126,13 +226,240 @@ def exportplaylist(uri, username=None, client_id=None, client_secret=None,
 
     You need to be authorized before you can use this command. See the README
     for details.
+
+    The last export of each playlist is cached. If the playlist has not
+    changed since then, the cached tracks are printed instead of downloading
+    them again.
     """
 
+    jobs = get_default(jobs, "Spotify", "jobs", int)
+    playlist_username, playlistid, open_spotify_uri = parse_playlist_uri(uri)
+
+    sys.stderr.write(
+        f"Searching for {playlist_username}'s playlist {playlistid}\n"
+    )
+
+    writer = csv_writer(sys.stdout, quoting=csv.QUOTE_ALL)
+
+    spotify = get_client(
+        username, client_id, client_secret, redirect_uri, jobs
+    )
+    results = get_playlist(spotify, playlist_username, playlistid)
+
+    rows, cached = get_playlist_rows(
+        spotify, playlist_username, playlistid, results, jobs, not no_cache
+    )
+    if cached and if_changed:
+        sys.stderr.write("The playlist has not changed.\n")
+        return
+
+    sys.stdout.write(f"# Playlist: {results['name']}\n")
+    sys.stdout.write(f"# Description: from {open_spotify_uri}\n")
+
+    csv_write_header(writer, ids)
+
+    for row in rows:
+        writer.writerow(row if ids else row[:3])
+
+
+@USERNAME_ARG
+@CLIENT_ID_ARG
+@CLIENT_SECRET_ARG
+@REDIRECT_URI_ARG
+@IDS_ARG
+@arg(
+    '--since',
+    help='Only export tracks saved on or after this UTC date or time, ' +
+         'like 2024-01-31 or 2024-01-31T18:00.'
+)
+@JOBS_ARG
+@named('export-library')
+def exportlibrary(username=None, client_id=None, client_secret=None,
+                  redirect_uri=None, ids=False, since=None, jobs=None):
+    """
+    Gets all the tracks saved in your Spotify library, newest first.
+
+    You need to be authorized before you can use this command. See the README
+    for details.
+
+    The library is downloaded in pages of 50 tracks, several pages at a time,
+    and each track is printed as soon as its page arrives. With --since, the
+    export stops at the first track that was saved before that time.
+    """
+
+    if since:
+        since = normalize_since(since)
+
+    jobs = get_default(jobs, "Spotify", "jobs", int)
+    spotify = get_client(
+        username, client_id, client_secret, redirect_uri, jobs
+    )
+
+    writer = csv_writer(sys.stdout, quoting=csv.QUOTE_ALL)
+    sys.stdout.write("# Playlist: Liked Songs\n")
+    sys.stdout.write("# Description: from the Spotify library\n")
+    csv_write_header(writer, ids)
+
+    exported = 0
+    for track in get_saved_tracks(spotify, since, jobs):
+        writer.writerow(track.to_row(ids))
+        exported = exported + 1
+
+    sys.stderr.write(f"{exported} tracks exported.\n")
+
+
+def normalize_since(since):
+    """
+    Expand a --since date or time to a full UTC time like
+    2024-01-31T18:00:00Z, the format of the times the tracks were saved at,
+    so the two can be compared as strings.
+    """
+    match = SINCE_PATTERN.match(since)
+    if not match:
+        raise CommandError(
+            "--since must be a date like 2024-01-31 or a time like " +
+            "2024-01-31T18:00."
+        )
+
+    date, minutes, seconds = match.groups()
+    return f"{date}T{minutes or '00:00'}{seconds or ':00'}Z"
+
+
+def get_saved_tracks(spotify, since=None, jobs=1):
+    """
+    Yield the user's saved tracks as Tracks, newest first.
+
+    The first page gives the number of tracks. The other pages are requested
+    by offset, ``jobs`` pages at a time. ``since`` is a UTC time as returned
+    by normalize_since(). When a track saved before it is found, no more
+    pages are read.
+    """
+    def get_page(offset):
+        page = spotify.current_user_saved_tracks(
+            limit=LIBRARY_PAGE_SIZE, offset=offset
+        )
+        # Keep only the times and Tracks, not the whole response
+        page['items'] = [
+            (item.get('added_at') or "", Track.from_spotify(item['track']))
+            for item in page['items'] if item.get('track')
+        ]
+        return page
+
+    first_page = get_page(0)
+    offsets = range(LIBRARY_PAGE_SIZE, first_page['total'], LIBRARY_PAGE_SIZE)
+    # The other pages are only requested once the first page is used up
+    other_pages = imap_ordered(get_page, offsets, jobs=jobs, window=jobs)
+
+    try:
+        pages = itertools.chain(
+            [first_page], (page for _, page in other_pages)
+        )
+        for page in pages:
+            for added_at, track in page['items']:
+                # ISO 8601 times in UTC sort the same as strings
+                if since and added_at < since:
+                    return
+                yield track
+    finally:
+        other_pages.close()
+
+
+def get_client(username, client_id, client_secret, redirect_uri, jobs=None):
+    """
+    Get an authorized Spotify client. Prompts for a token if required.
+
+    The token is kept in memory and refreshed before it expires, so the
+    client can be used for as long as needed. The client uses the shared
+    Spotify HTTP session, with a connection pool big enough for ``jobs``
+    parallel requests.
+    """
+    import spotipy
+
+    username = get_default(username, "Spotify", "username")
+    client_id = get_default(client_id, "Spotify", "client-id")
+    client_secret = get_default(client_secret, "Spotify", "client-secret")
+    redirect_uri = get_default(redirect_uri, "Spotify", "redirect-uri")
+
     check_required_arg(username, "Username")
     check_required_arg(client_id, "Client ID")
     check_required_arg(client_secret, "Client Secret")
     check_required_arg(redirect_uri, "Redirect URL")
 
+    token_manager = get_token_manager(
+        username, scope=SPOTIFY_API_SCOPE,
+        client_id=client_id, client_secret=client_secret,
+        redirect_uri=redirect_uri
+    )
+    if not token_manager:
+        raise CommandError("Unable to get a Spotify token.")
+
+    return throttle(spotipy.Spotify(
+        auth_manager=token_manager,
+        requests_session=get_session("spotify", jobs)
+    ))
+
+
+def throttle(spotify):
+    """
+    Wrap a Spotify client so its calls are rate limited and retried when
+    they are throttled.
+    """
+    rate = get_default(None, "Spotify", "rate", float)
+    max_rate = get_default(None, "Spotify", "max-rate", float)
+    max_retries = get_default(None, "Spotify", "max-retries", int)
+    return ThrottledClient(
+        spotify, RateLimiter(rate, max_rate=max_rate), max_retries=max_retries
+    )
+
+
+def get_playlist(spotify, playlist_username, playlistid):
+    """Get a playlist's name, snapshot ID and number of tracks."""
+    fields = "name,snapshot_id,tracks.total"
+    if playlist_username:
+        return spotify.user_playlist(
+            playlist_username, playlistid, fields=fields
+        )
+    else:
+        return spotify.playlist(
+            playlistid, fields=fields
+        )
+
+
+def get_playlist_rows(spotify, playlist_username, playlistid, playlist,
+                      jobs=1, use_cache=True):
+    """
+    Get the rows (with IDs) of every track in a playlist, using the export
+    cache if the playlist has not changed. ``playlist`` is the result of
+    get_playlist.
+
+    Returns a tuple of the rows iterator and whether it comes from the cache.
+    """
+    snapshot_id = playlist.get('snapshot_id')
+    cache = ExportCache(get_cache_path("spotify")) if use_cache else None
+
+    if cache and cache.is_current(playlistid, snapshot_id):
+        logging.debug(f"Using cached export of snapshot {snapshot_id}")
+        return cache.load(playlistid), True
+
+    pages = get_playlist_pages(
+        spotify, playlist_username, playlistid, playlist['tracks']['total'],
+        jobs
+    )
+    rows = (track.to_row(ids=True) for tracks in pages for track in tracks)
+
+    if cache:
+        rows = cache.save(playlistid, snapshot_id, playlist['name'], rows)
+
+    return rows, False
+
+
+def parse_playlist_uri(uri):
+    """
+    Parse a playlist URI or URL.
+
+    Returns a tuple of the playlist owner (or None), the playlist ID and the
+    open.spotify.com URL of the playlist.
+    """
     pattern = "http://open.spotify.com/user/([^/]+)/playlist/(.+)"
     pattern2 = "https://open.spotify.com/playlist/(.+)"
     alt_pattern = "spotify:user:([^:]+):playlist:(.+)"
@@ -156,53 +483,42 @@ def exportplaylist(uri, username=None, client_id=None, client_secret=None,
             "Cannot read the playlist URI. See the help for expected format."
         )
 
-    sys.stderr.write(
-        f"Searching for {playlist_username}'s playlist {playlistid}\n"
-    )
-
-    writer = csv.writer(sys.stdout, quoting=csv.QUOTE_ALL)
+    return playlist_username, playlistid, open_spotify_uri
 
-    token = prompt_for_user_token(
-        username, scope=SPOTIFY_API_SCOPE,
-        client_id=client_id, client_secret=client_secret,
-        redirect_uri=redirect_uri
-    )
 
-    spotify = spotipy.Spotify(auth=token)
-    if playlist_username:
-        results = spotify.user_playlist(
-            playlist_username, playlistid, fields="name,tracks,next"
-        )
-    else:
-        results = spotify.playlist(
-            playlistid, fields="name,tracks,next"
-        )
+def get_playlist_pages(spotify, playlist_username, playlistid, total,
+                       jobs=1):
+    """
+    Yield the Tracks of every page of a playlist, in order.
 
-    sys.stdout.write(f"# Playlist: {results['name']}\n")
-    sys.stdout.write(f"# Description: from {open_spotify_uri}\n")
+    The pages are requested by offset, ``jobs`` pages at a time, and each
+    page is converted to a list of Tracks by the thread that requested it.
+    ``total`` is the number of tracks in the playlist.
+    """
+    limit = PLAYLIST_PAGE_SIZE
+    offsets = range(0, total, limit)
+
+    def get_page(offset):
+        if playlist_username:
+            page = spotify.user_playlist_tracks(
+                playlist_username, playlistid, limit=limit, offset=offset
+            )
+        else:
+            page = spotify.playlist_tracks(
+                playlistid, limit=limit, offset=offset
+            )
+        return [
+            Track.from_spotify(item['track'])
+            for item in page['items'] if item['track']
+        ]
 
-    csv_write_header(writer)
+    for _, page in imap_ordered(get_page, offsets, jobs=jobs):
+        yield page
 
-    tracks = results['tracks']
-    csv_write_tracks(writer, tracks)
-    while tracks['next']:
-        tracks = spotify.next(tracks)
-        csv_write_tracks(writer, tracks)
 
-def csv_write_header(writer):
+def csv_write_header(writer, ids=False):
     """Writes the header row in CSV format"""
-    writer.writerow(["Track", "Artist", "Album"])
-
-def csv_write_tracks(writer, tracks):
-    """Writes a list of tracks in CSV format"""
-    for trackitem in tracks['items']:
-        track = trackitem['track']
-        csv_write_track(writer, track)
-
-def csv_write_track(writer, track):
-    """Writes a single track in CSV format"""
-    title = track['name']
-    album = track['album']['name']
-    artist = track['artists'][0]['name']
-
-    writer.writerow([title, artist, album])
+    if ids:
+        writer.writerow(["Track", "Artist", "Album", "Spotify ID", "ISRC"])
+    else:
+        writer.writerow(["Track", "Artist", "Album"])
@@ -8,8 +8,11 @@ __version__ = "0.2.0"
 import argparse
 import logging
 from argh import ArghParser
-from .spotify import exporttracks, exportplaylist, checktoken
+from . import profiling
+from .spotify import exporttracks, exportplaylist, exportlibrary, checktoken
 from .allaccess import allaccessimport, allaccesslogin, allaccessexport
+from .transfer import transfer
+from .batch import batch
 
 # These arguments are used by this global dispatcher and each individual
 # stand-alone commands.
@@ -18,6 +21,19 @@ COMMON_PARSER.add_argument('--debug',
                            action='store_true',
                            default=False,
                            help="Enable debug logging.")
+COMMON_PARSER.add_argument('--profile',
+                           action='store_true',
+                           default=False,
+                           help="Print a JSON report of the count, size and "
+                           "latency of every API call and CSV row to stderr.")
+COMMON_PARSER.add_argument('--profile-output',
+                           metavar='FILE',
+                           help="Write the --profile report to FILE instead. "
+                           "Implies --profile.")
+COMMON_PARSER.add_argument('--cprofile',
+                           metavar='FILE',
+                           help="Run the command under cProfile and dump the "
+                           "stats to FILE. Only the main thread is profiled.")
 
 
 def main():
@@ -27,7 +43,8 @@ def main():
     """
     parser = ArghParser(parents=[COMMON_PARSER])
     parser.add_commands([allaccessimport, allaccessexport, allaccesslogin], namespace="gmusic")
-    parser.add_commands([exporttracks, checktoken, exportplaylist], namespace="spotify")
+    parser.add_commands([exporttracks, checktoken, exportplaylist, exportlibrary], namespace="spotify")
+    parser.add_commands([transfer, batch])
 
     args = parser.parse_args()
 
@@ -37,4 +54,21 @@ def main():
             format='%(asctime)s %(levelname)s: %(message)s'
         )
 
-    parser.dispatch()
+    report_path = args.profile_output or ("-" if args.profile else None)
+    if report_path:
+        profiling.enable()
+
+    profiler = None
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        parser.dispatch()
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+        if report_path:
+            profiling.write_report(report_path)
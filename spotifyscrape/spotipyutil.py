@@ -2,17 +2,86 @@
 # PYTHON_ARGCOMPLETE_OK
 
 """
-Interactively prompts for Spotify OAuth tokens.
+Interactively prompts for Spotify OAuth tokens and keeps them fresh.
 """
 
+import logging
 import os
 import sys
 import subprocess
-from spotipy import oauth2
-import spotipy
+import threading
+import time
 
 TOKEN_CACHE_PATH = os.path.expanduser("~/.spotify-oauth")
 
+# Refresh the access token this many seconds before it expires
+REFRESH_MARGIN = 300
+
+TOKEN_MANAGERS = dict()
+TOKEN_MANAGERS_LOCK = threading.Lock()
+
+
+class TokenManager(object):
+    """
+    Keeps a user's Spotify token in memory and refreshes it before it
+    expires, so long runs never use an expired token.
+
+    A background thread refreshes the token ``REFRESH_MARGIN`` seconds before
+    it expires. If that did not happen in time, the next caller refreshes it
+    instead. The manager can be shared by any number of threads, and can be
+    given to ``spotipy.Spotify`` as its ``auth_manager``.
+    """
+
+    def __init__(self, sp_oauth, token_info):
+        self.sp_oauth = sp_oauth
+        self.token_info = token_info
+        self.lock = threading.Lock()
+        self.timer = None
+        self._schedule()
+
+    def get_access_token(self, as_dict=False, check_cache=True):
+        """Get a valid access token, refreshing it first if required."""
+        with self.lock:
+            if self._expires_in() < REFRESH_MARGIN:
+                self._refresh()
+
+            return self.token_info if as_dict else self.token_info['access_token']
+
+    def _expires_in(self):
+        """The number of seconds until the token expires."""
+        return self.token_info.get('expires_at', 0) - time.time()
+
+    def _refresh(self):
+        """Refresh the token. Must hold the lock."""
+        logging.debug("Refreshing the Spotify access token")
+        token_info = self.sp_oauth.refresh_access_token(
+            self.token_info['refresh_token']
+        )
+        # Spotify does not always send a new refresh token
+        token_info.setdefault('refresh_token', self.token_info['refresh_token'])
+        self.token_info = token_info
+        self._schedule()
+
+    def _schedule(self):
+        """Schedule the background refresh of the current token."""
+        if self.timer:
+            self.timer.cancel()
+
+        delay = max(0, self._expires_in() - REFRESH_MARGIN)
+        self.timer = threading.Timer(delay, self._refresh_in_background)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def _refresh_in_background(self):
+        with self.lock:
+            if self._expires_in() >= REFRESH_MARGIN:
+                return
+            try:
+                self._refresh()
+            except Exception as error:
+                # The next caller will try again
+                logging.debug(f"Background token refresh failed: {error}")
+
 
 def prompt_for_user_token(username, scope=None, client_id=None,
                           client_secret=None, redirect_uri=None):
@@ -30,6 +99,56 @@ def prompt_for_user_token(username, scope=None, client_id=None,
 
     '''
 
+    manager = get_token_manager(
+        username, scope=scope, client_id=client_id,
+        client_secret=client_secret, redirect_uri=redirect_uri
+    )
+
+    if manager:
+        return manager.get_access_token()
+    else:
+        return None
+
+
+def get_token_manager(username, scope=None, client_id=None,
+                      client_secret=None, redirect_uri=None):
+    ''' returns the TokenManager of a user, prompting the user to login
+        only if there is no cached token that can be refreshed.
+
+        Managers are kept for the life of the process, so the token cache
+        file is only read once.
+    '''
+
+    key = (username, scope, client_id)
+    with TOKEN_MANAGERS_LOCK:
+        if key not in TOKEN_MANAGERS:
+            token_info = None
+            sp_oauth = get_oauth(
+                username, scope, client_id, client_secret, redirect_uri
+            )
+
+            # try to get a valid token for this user, from the cache,
+            # if not in the cache, the create a new (this will send
+            # the user to a web page where they can authorize this app)
+            token_info = sp_oauth.get_cached_token()
+
+            if not token_info or not token_info.get('refresh_token'):
+                token_info = prompt_for_authorization(sp_oauth)
+
+            if not token_info:
+                return None
+
+            TOKEN_MANAGERS[key] = TokenManager(sp_oauth, token_info)
+
+        return TOKEN_MANAGERS[key]
+
+
+def get_oauth(username, scope, client_id, client_secret, redirect_uri):
+    '''creates the SpotifyOAuth object for a user'''
+
+    from spotipy import oauth2
+    import spotipy
+
     if not os.path.exists(TOKEN_CACHE_PATH):
         os.makedirs(TOKEN_CACHE_PATH)
 
@@ -58,49 +177,44 @@ def prompt_for_user_token(username, scope=None, client_id=None,
 
     cache_path = os.path.join(TOKEN_CACHE_PATH, ".cache-" + username)
 
-    sp_oauth = oauth2.SpotifyOAuth(
+    return oauth2.SpotifyOAuth(
         client_id, client_secret, redirect_uri,
         scope=scope, cache_path=cache_path
     )
 
-    # try to get a valid token for this user, from the cache,
-    # if not in the cache, the create a new (this will send
-    # the user to a web page where they can authorize this app)
 
-    token_info = sp_oauth.get_cached_token()
+def prompt_for_authorization(sp_oauth):
+    '''interactively asks the user to authorize the app and returns the
+       new token info'''
 
-    if not token_info:
-        sys.stderr.write('''
+    sys.stderr.write('''
 
-            User authentication requires interaction with your
-            web browser. Once you enter your credentials and
-            give authorization, you will be redirected to
-            a url.  Paste that url you were directed to to
-            complete the authorization.
+        User authentication requires interaction with your
+        web browser. Once you enter your credentials and
+        give authorization, you will be redirected to
+        a url.  Paste that url you were directed to to
+        complete the authorization.
 
-        ''')
-        auth_url = sp_oauth.get_authorize_url()
+    ''')
+    auth_url = sp_oauth.get_authorize_url()
+    try:
+        subprocess.call(["open", auth_url])
+        sys.stderr.write(f"Opening {auth_url} in your browser\n")
+    except:
         try:
-            subprocess.call(["open", auth_url])
-            sys.stderr.write(f"Opening {auth_url} in your browser\n")
+            subprocess.call(["cygstart", auth_url])
+            sys.stderr.write(
+                f"Opening {auth_url} in your browser\n"
+            )
         except:
-            try:
-                subprocess.call(["cygstart", auth_url])
-                sys.stderr.write(
-                    f"Opening {auth_url} in your browser\n"
-                )
-            except:
-                sys.stderr.write(f'Please navigate here: {auth_url}\n')
-
-        sys.stderr.write("\n\n")
-        response = raw_input("Enter the URL you were redirected to: ")
-        sys.stderr.write("\n\n")
-        sys.stderr.write("\n\n")
-
-        code = sp_oauth.parse_response_code(response)
-        token_info = sp_oauth.get_access_token(code)
-    # Auth'ed API request
-    if token_info:
-        return token_info['access_token']
-    else:
-        return None
+            sys.stderr.write(f'Please navigate here: {auth_url}\n')
+
+    sys.stderr.write("\n\n")
+    sys.stderr.write("Enter the URL you were redirected to: ")
+    sys.stderr.flush()
+    response = input()
+    sys.stderr.write("\n\n")
+    sys.stderr.write("\n\n")
+
+    code = sp_oauth.parse_response_code(response)
+    return sp_oauth.get_access_token(code)
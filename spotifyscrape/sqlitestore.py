@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Base class of the local stores kept in SQLite databases"""
+
+import sqlite3
+import threading
+
+
+class SQLiteStore(object):
+    """
+    A SQLite database that can be shared by multiple threads.
+
+    The connection must only be used while holding ``lock``. Changes are
+    committed every ``commit_interval`` writes and when the store is closed,
+    so close it in a ``finally`` block to keep the last changes.
+    """
+
+    def __init__(self, path, schema, commit_interval=100):
+        self.commit_interval = commit_interval
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(schema)
+        self.connection.commit()
+
+    def close(self):
+        """Commit the pending changes and close the database."""
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+    def _write(self, statement, parameters=()):
+        """
+        Run a statement that counts as one write. Must hold the lock.
+        Returns the cursor.
+        """
+        cursor = self.connection.execute(statement, parameters)
+        self.writes = self.writes + 1
+        if self.writes % self.commit_interval == 0:
+            self.connection.commit()
+        return cursor
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""A compact record of one track, shared by the export and import commands"""
+
+from collections import namedtuple
+
+
+class Track(namedtuple("Track", "title artist album spotify_id isrc store_id")):
+    """
+    The title, artist, album and IDs of a track.
+
+    API responses hold much more than the few fields we use, so they are
+    converted to a Track as soon as they arrive and the response is dropped.
+    A Track is a tuple, without a per-instance dict, so it takes a fraction
+    of the memory of the response. IDs that are not known are None.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_spotify(cls, track):
+        """Build a Track from a Spotify track object."""
+        return cls(
+            track['name'], track['artists'][0]['name'], track['album']['name'],
+            track.get('id') or None,
+            track.get('external_ids', {}).get('isrc') or None,
+            None
+        )
+
+    @classmethod
+    def from_store(cls, track):
+        """Build a Track from a Google Music track dict."""
+        return cls(
+            track['title'], track['artist'], track['album'],
+            None, None, track.get('storeId') or track.get('nid') or None
+        )
+
+    def to_row(self, ids=False):
+        """The Track, Artist and Album, and optionally the IDs, as a CSV row."""
+        if ids:
+            return [
+                self.title, self.artist, self.album,
+                self.spotify_id or '', self.isrc or ''
+            ]
+        else:
+            return [self.title, self.artist, self.album]
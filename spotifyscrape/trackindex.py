@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Track which songs are in a playlist to detect duplicates"""
+
+from collections import Counter
+
+
+class TrackIndex(object):
+    """
+    Counts the store IDs already in a playlist and the ones requested during
+    this run, so duplicate checks take constant time.
+
+    By default a track is added only once. If ``allow_repeats`` is set, a
+    track that appears several times in the input is added until the
+    playlist has as many copies as the input asks for.
+    """
+
+    def __init__(self, store_ids=(), allow_repeats=False):
+        self.existing = Counter(store_ids)
+        self.requested = Counter()
+        self.allow_repeats = allow_repeats
+
+    def add(self, store_id):
+        """
+        Record that the input asks for a track.
+
+        Returns True if the track should be added to the playlist or False if
+        it is a duplicate.
+        """
+        self.requested[store_id] += 1
+        count = self.requested[store_id]
+
+        if self.allow_repeats:
+            return count > self.existing[store_id]
+        else:
+            return count == 1 and store_id not in self.existing
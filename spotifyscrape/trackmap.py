@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Persistent mapping of Spotify tracks to All Access store IDs"""
+
+import time
+
+from .sqlitestore import SQLiteStore
+
+# Commit to disk after this many writes
+COMMIT_INTERVAL = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS track_map (
+    key TEXT PRIMARY KEY,
+    store_id TEXT NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class TrackMap(SQLiteStore):
+    """
+    Maps Spotify track IDs and ISRCs to the All Access store IDs they were
+    resolved to, so a track is only searched for once.
+    """
+
+    def __init__(self, path):
+        super(TrackMap, self).__init__(path, SCHEMA, COMMIT_INTERVAL)
+        self.hits = 0
+
+    def get(self, spotify_id=None, isrc=None):
+        """Get the store ID of a track by its Spotify ID or ISRC, or None."""
+        with self.lock:
+            for key in self._keys(spotify_id, isrc):
+                row = self.connection.execute(
+                    "SELECT store_id FROM track_map WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    self.hits = self.hits + 1
+                    return row[0]
+
+        return None
+
+    def put(self, store_id, spotify_id=None, isrc=None):
+        """Record the store ID a track was resolved to."""
+        now = time.time()
+        with self.lock:
+            for key in self._keys(spotify_id, isrc):
+                self._write(
+                    "INSERT OR REPLACE INTO track_map (key, store_id, updated) "
+                    "VALUES (?, ?, ?)",
+                    (key, store_id, now)
+                )
+
+    @staticmethod
+    def _keys(spotify_id, isrc):
+        """Get the keys a track is stored under."""
+        keys = list()
+        if spotify_id:
+            keys.append(f"spotify:{spotify_id}")
+        if isrc:
+            keys.append(f"isrc:{isrc.upper()}")
+        return keys
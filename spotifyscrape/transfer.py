@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# PYTHON_ARGCOMPLETE_OK
+
+"""Copy a Spotify playlist to All Access in a single process"""
+
+from argh import arg, named
+
+from .allaccess import (
+    login, import_rows, open_import_options, DRY_RUN_ARG, BATCH_SIZE_ARG,
+    BATCH_INTERVAL_ARG, JOBS_ARG, SEARCH_RATE_ARG, ALLOW_REPEATS_ARG,
+    RESUME_ARG
+)
+from .config import get_default
+from .parallel import prefetch
+from .spotify import (
+    get_client, get_playlist, get_playlist_rows, parse_playlist_uri,
+    USERNAME_ARG, CLIENT_SECRET_ARG, REDIRECT_URI_ARG, IF_CHANGED_ARG
+)
+
+SPOTIFY_CLIENT_ID_ARG = arg(
+    '--spotify-client-id'
+)
+GMUSIC_CLIENT_ID_ARG = arg(
+    '--gmusic-client-id', help='A unique ID for this All Access client'
+)
+PAGE_JOBS_ARG = arg(
+    '--page-jobs', type=int,
+    help='The number of Spotify pages to download at the same time.'
+)
+QUEUE_SIZE_ARG = arg(
+    '--queue-size', help='The maximum number of downloaded tracks waiting ' +
+                         'to be searched.'
+)
+NO_CACHE_ARG = arg(
+    '--no-cache', help='Do not use the Spotify export cache, the search cache ' +
+                       'or the catalog index.'
+)
+
+
+@arg('uri', help='The Spotify playlist URI or URL')
+@arg(
+    '--name', help='The All Access playlist name. ' +
+                   'Defaults to the name of the Spotify playlist.'
+)
+@USERNAME_ARG
+@SPOTIFY_CLIENT_ID_ARG
+@CLIENT_SECRET_ARG
+@REDIRECT_URI_ARG
+@GMUSIC_CLIENT_ID_ARG
+@PAGE_JOBS_ARG
+@QUEUE_SIZE_ARG
+@DRY_RUN_ARG
+@BATCH_SIZE_ARG
+@BATCH_INTERVAL_ARG
+@JOBS_ARG
+@SEARCH_RATE_ARG
+@NO_CACHE_ARG
+@IF_CHANGED_ARG
+@ALLOW_REPEATS_ARG
+@RESUME_ARG
+@named('transfer')
+def transfer(uri, name=None, username=None, spotify_client_id=None,
+             client_secret=None, redirect_uri=None, gmusic_client_id=None,
+             page_jobs=None, queue_size=1000, dry_run=False, batch_size=None,
+             batch_interval=None, jobs=None, search_rate=None, no_cache=False,
+             if_changed=False, allow_repeats=False, resume=False):
+    """
+    Copies a Spotify playlist to a Google Play Music All Access playlist.
+
+    This does the same as piping "spotify export" into "gmusic import", but
+    in one process. Tracks are searched as soon as they are downloaded, while
+    later pages are still being fetched.
+
+    If the Spotify playlist has not changed since it was last exported, the
+    cached export is used. With --if-changed, nothing is done at all.
+    """
+
+    page_jobs = get_default(page_jobs, "Spotify", "jobs", int)
+    parse_playlist_uri(uri)
+
+    options = open_import_options(
+        no_cache, dry_run=dry_run, batch_size=batch_size,
+        batch_interval=batch_interval, jobs=jobs, allow_repeats=allow_repeats,
+        resume=resume
+    )
+
+    try:
+        yield from copy_playlist(
+            lambda: get_client(
+                username, spotify_client_id, client_secret, redirect_uri,
+                page_jobs
+            ),
+            lambda: login(gmusic_client_id, search_rate, jobs),
+            uri, options, name, page_jobs=page_jobs, queue_size=queue_size,
+            use_cache=not no_cache, if_changed=if_changed
+        )
+        yield from options.get_cache_stats()
+    finally:
+        options.close()
+
+
+def copy_playlist(get_spotify, get_api, uri, options, name=None,
+                  page_jobs=1, queue_size=1000, use_cache=True,
+                  if_changed=False):
+    """
+    Copy one Spotify playlist to All Access, with the ImportOptions
+    ``options``. Yields the progress messages.
+
+    ``get_spotify`` and ``get_api`` are called to get the Spotify and All
+    Access clients when they are first needed, so the user does not log in
+    to All Access if the playlist has not changed. If ``options`` has a
+    playlist index, the import holds the lock of the playlist name, which is
+    only known once the Spotify playlist is downloaded.
+    """
+    playlist_username, playlistid, open_spotify_uri = parse_playlist_uri(uri)
+
+    spotify = get_spotify()
+    results = get_playlist(spotify, playlist_username, playlistid)
+
+    rows, cached = get_playlist_rows(
+        spotify, playlist_username, playlistid, results, page_jobs, use_cache
+    )
+    if cached and if_changed:
+        yield "The playlist has not changed."
+        return
+
+    header = {
+        'name': name or results['name'],
+        'description': f"from {open_spotify_uri}",
+    }
+
+    rows = prefetch(rows, queue_size)
+    if options.playlist_index is None:
+        # No other copies share these options, so there is nothing to wait for
+        yield from import_rows(get_api(), rows, header, options)
+        return
+
+    # Copies to the same playlist name share the playlist and its journal,
+    # so they run one after the other
+    with options.playlist_index.name_lock(header['name']):
+        yield from import_rows(get_api(), rows, header, options)